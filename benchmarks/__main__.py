@@ -0,0 +1,60 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks [output file], results are written as json
+# so runs before and after a change can be compared
+
+
+from benchmarks import color, worker, monitor, device_manager, device_model
+import sys, os, json, time, platform
+
+
+suites = {
+    "color": color.run,
+    "worker": worker.run,
+    "monitor": monitor.run,
+    "device_manager": device_manager.run,
+    "device_model": device_model.run
+}
+
+
+def run() -> dict:
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count()
+        }
+    }
+    for name, suite in suites.items():
+        print("running '{}' ...".format(name))
+        results[name] = suite()
+    return results
+
+
+if __name__ == '__main__':
+    output = sys.argv[1] if len(sys.argv) > 1 else "bench_output.txt"
+    results = run()
+    for name, suite in results.items():
+        if name == "meta":
+            continue
+        for case, result in suite.items():
+            print("{:<16} {:<32} {:>12.3f} us/item".format(name, case, result["per_item_us"]))
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("results written to '{}'".format(output))
@@ -0,0 +1,51 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks.color
+
+
+from hue_bridge.color import getColorEngine, convertHSBToRGB, convertRGBToHSB
+from rgbxy import Converter, GamutC
+import random, timeit
+
+
+def run(count: int = 10000, repeat: int = 5) -> dict:
+    random.seed(0)
+    hsb = [(random.randint(0, 360), random.randint(0, 100), random.randint(1, 100)) for _ in range(count)]
+    converter = Converter(GamutC)
+    engine = getColorEngine(GamutC)
+    xy = [converter.rgb_to_xy(*convertHSBToRGB(*values)) for values in hsb]
+    engine.hsbToXY(0, 0, 100)
+    engine.xyToHSB(0.3, 0.3)
+    hues, saturations, brightnesses = zip(*hsb)
+    cases = {
+        "hsb_to_xy_per_call": lambda: [converter.rgb_to_xy(*convertHSBToRGB(*values)) for values in hsb],
+        "hsb_to_xy_lookup": lambda: [engine.hsbToXY(*values) for values in hsb],
+        "hsb_to_xy_batch": lambda: engine.hsbToXYBatch(hues, saturations, brightnesses),
+        "xy_to_hsb_per_call": lambda: [convertRGBToHSB(*converter.xy_to_rgb(*values)) for values in xy],
+        "xy_to_hsb_lookup": lambda: [engine.xyToHSB(*values) for values in xy],
+        "xy_to_hsb_batch": lambda: engine.xyToHSBBatch(xy)
+    }
+    results = dict()
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        results[name] = {"count": count, "total_s": best, "per_item_us": best / count * 1e6}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{:<22} {:>10.3f} us/item".format(name, result["per_item_us"]))
@@ -0,0 +1,93 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks.device_manager
+
+
+from benchmarks.fakes import getDevices
+from hue_bridge.device_manager import DeviceManager
+from threading import Thread, Barrier
+import time, random
+
+
+def worker(device_manager: DeviceManager, ids: list, spares: list, operations: int, seed: int, barrier: Barrier):
+    # mostly lookups like the controller does, a few full copies like the monitor and some churn
+    rand = random.Random(seed)
+    barrier.wait()
+    for number in range(operations):
+        kind = number % 20
+        spare = spares[number // 20 % len(spares)]
+        if kind < 16:
+            device_manager.get(ids[rand.randrange(len(ids))])
+        elif kind == 16:
+            device_manager.devices
+        elif kind == 17:
+            device_manager.add(spare)
+        elif kind == 18:
+            device_manager.get(spare.id)
+        else:
+            device_manager.delete(spare.id)
+
+
+def runThreads(device_count: int, thread_count: int, operations: int) -> float:
+    devices = getDevices(device_count + thread_count * 8)
+    device_manager = DeviceManager()
+    for device in devices[:device_count]:
+        device_manager.add(device)
+    ids = [device.id for device in devices[:device_count]]
+    barrier = Barrier(thread_count + 1)
+    threads = [
+        Thread(
+            target=worker,
+            args=(
+                device_manager,
+                ids,
+                devices[device_count + number * 8:device_count + (number + 1) * 8],
+                operations,
+                number,
+                barrier
+            ),
+            daemon=True
+        )
+        for number in range(thread_count)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run(device_count: int = 500, threads: tuple = (1, 2, 4, 8), operations: int = 20000, repeat: int = 3) -> dict:
+    random.seed(0)
+    results = dict()
+    for thread_count in threads:
+        best = min(runThreads(device_count, thread_count, operations) for _ in range(repeat))
+        total = thread_count * operations
+        results["device_manager_{}_threads".format(thread_count)] = {
+            "count": total,
+            "total_s": best,
+            "per_item_us": best / total * 1e6,
+            "ops_per_s": total / best
+        }
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{:<28} {:>10.3f} us/op {:>12.0f} ops/s".format(name, result["per_item_us"], result["ops_per_s"]))
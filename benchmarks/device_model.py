@@ -0,0 +1,89 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks.device_model
+
+
+from benchmarks.fakes import getDevices, getState
+import time, random, tracemalloc, timeit
+
+
+def getBridgeState() -> dict:
+    # a state as the bridge reports it, including the fields the connector doesn't use
+    return dict(
+        getState(),
+        hue=random.randint(0, 65535),
+        sat=random.randint(0, 254),
+        effect="none",
+        alert="select",
+        mode="homeautomation"
+    )
+
+
+def measureMemory(count: int) -> tuple:
+    states = [getBridgeState() for _ in range(count)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    devices = getDevices(count)
+    for device, state in zip(devices, states):
+        device.state = state
+    duration = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / count, duration
+
+
+def run(count: int = 10000, repeat: int = 5) -> dict:
+    random.seed(0)
+    bytes_per_device, duration = measureMemory(count)
+    results = {
+        "create_devices": {
+            "count": count,
+            "total_s": duration,
+            "per_item_us": duration / count * 1e6,
+            "bytes_per_device": bytes_per_device
+        }
+    }
+    devices = getDevices(count)
+    polled = [getBridgeState() for _ in range(count)]
+    updates = [{"bri": random.randint(1, 254)} for _ in range(count)]
+
+    def pollUpdate():
+        # the monitor replaces the whole state after a query
+        for device, state in zip(devices, polled):
+            device.state = state
+
+    def eventUpdate():
+        # event stream updates carry single fields
+        for device, update in zip(devices, updates):
+            device.state = device.state.merge(update)
+
+    def read():
+        for device in devices:
+            state = device.state
+            state.on, state.bri, state.xy, state.reachable
+
+    for name, case in (("state_poll_update", pollUpdate), ("state_event_update", eventUpdate), ("state_read", read)):
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        results[name] = {"count": count, "total_s": best, "per_item_us": best / count * 1e6}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{:<28} {:>10.3f} us/item".format(name, result["per_item_us"]))
+        if "bytes_per_device" in result:
+            print("{:<28} {:>10.0f} bytes/device".format("", result["bytes_per_device"]))
@@ -0,0 +1,167 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# stand-ins for the hub client and the bridge, so the hot paths can be timed without network
+
+
+from hue_bridge.bridges import BridgeInfo, bridge_pool
+from hue_bridge.transport import transport_pool
+from hue_bridge.rate_limiter import RateLimiter
+from hue_bridge.resilience import CircuitBreaker
+from hue_bridge.types.device import ExtendedColorLight
+from threading import Lock, Event
+import time, json, random, cc_lib
+
+
+bridge_id = "BENCHMARK"
+
+models = ("LCT015", "LCT001", "LLC010", "LST002")
+
+
+class FakeFuture:
+    def wait(self, timeout: float = None) -> bool:
+        return True
+
+    def done(self) -> bool:
+        return True
+
+    def result(self):
+        return None
+
+
+class FakeClient:
+    def __init__(self):
+        self.__lock = Lock()
+        self.__expected = 0
+        self.__done = Event()
+        self.responses = 0
+        self.events = 0
+        self.calls = 0
+
+    def expect(self, count: int):
+        with self.__lock:
+            self.responses = 0
+            self.__expected = count
+            self.__done.clear()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.__done.wait(timeout)
+
+    def sendResponse(self, command, asynchronous: bool = False):
+        with self.__lock:
+            self.responses += 1
+            if self.responses >= self.__expected:
+                self.__done.set()
+
+    def emmitEvent(self, envelope, asynchronous: bool = False):
+        self.events += 1
+
+    def __call(self, asynchronous: bool):
+        self.calls += 1
+        if asynchronous:
+            return FakeFuture()
+
+    def addDevice(self, device, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+    def updateDevice(self, device, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+    def deleteDevice(self, device, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+    def connectDevice(self, device, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+    def disconnectDevice(self, device, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+    def syncHub(self, devices, asynchronous: bool = False):
+        return self.__call(asynchronous)
+
+
+class FakeCommand:
+    def __init__(self, device_id: str, service_uri: str, data: dict = None):
+        self.correlation_id = "{}-{}".format(device_id, random.getrandbits(32))
+        self.device_id = device_id
+        self.service_uri = service_uri
+        self.completion_strategy = cc_lib.client.CompletionStrategy.pessimistic
+        self.timestamp = time.time()
+        self.message = cc_lib.client.message.Message(json.dumps(data) if data is not None else "")
+
+    def __str__(self):
+        return "correlation_id: {}, device_id: {}, service_uri: {}".format(
+            self.correlation_id,
+            self.device_id,
+            self.service_uri
+        )
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.__body = body
+
+    def json(self):
+        return self.__body
+
+
+class FakeTransport:
+    # answers like a bridge that accepts every request, without rate limiting
+    def __init__(self, state: dict):
+        self.rate_limiter = RateLimiter(1e9, 1000000, 1e9, 1000000)
+        self.breaker = CircuitBreaker(bridge_id, 5, 15.0)
+        self.__state = state
+        self.host = "127.0.0.1"
+
+    def getLight(self, number: str):
+        return FakeResponse({"state": self.__state})
+
+    def putLightState(self, number: str, data: dict):
+        return FakeResponse([{"success": {"/lights/{}/state/{}".format(number, key): value}} for key, value in data.items()])
+
+    def putGroupAction(self, number: str, data: dict):
+        return self.putLightState(number, data)
+
+
+def getState() -> dict:
+    return {
+        "on": True,
+        "bri": random.randint(1, 254),
+        "xy": [round(random.uniform(0.15, 0.6), 4), round(random.uniform(0.05, 0.6), 4)],
+        "ct": random.randint(153, 500),
+        "colormode": "xy",
+        "reachable": True
+    }
+
+
+def setupBridge():
+    bridge_pool[bridge_id] = BridgeInfo(bridge_id, "benchmark", "127.0.0.1")
+    transport_pool[bridge_id] = FakeTransport(getState())
+
+
+def getDevices(count: int) -> list:
+    return [
+        ExtendedColorLight(
+            "00:17:88:01:00:{:06x}-0b".format(number),
+            "light {}".format(number),
+            models[number % len(models)],
+            getState(),
+            str(number + 1),
+            bridge_id
+        )
+        for number in range(count)
+    ]
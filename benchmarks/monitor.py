@@ -0,0 +1,103 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks.monitor
+
+
+from benchmarks.fakes import FakeClient, setupBridge, getState, models, bridge_id
+from hue_bridge.configuration import config
+from hue_bridge.device_manager import DeviceManager
+from hue_bridge.monitor import Monitor
+import time, random
+
+
+def getQueriedDevices(count: int) -> dict:
+    return {
+        "00:17:88:01:00:{:06x}-0b".format(number): (
+            {
+                "name": "light {}".format(number),
+                "model": models[number % len(models)],
+                "state": getState(),
+                "number": str(number + 1)
+            },
+            {
+                "product_name": "Hue color lamp",
+                "manufacturer": "Signify Netherlands B.V.",
+                "product_type": "Extended color light"
+            }
+        )
+        for number in range(count)
+    }
+
+
+def changeStates(queried: dict, share: float) -> dict:
+    changed = dict()
+    for key, (attributes, info) in queried.items():
+        if random.random() < share:
+            attributes = dict(attributes, state=dict(attributes["state"], bri=random.randint(1, 254)))
+        changed[key] = (attributes, info)
+    return changed
+
+
+def measure(case, repeat: int, setup=None) -> float:
+    timings = list()
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        case()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes: tuple = (50, 500, 5000), repeat: int = 5) -> dict:
+    random.seed(0)
+    setupBridge()
+    results = dict()
+    # snapshot writes would be timed with the evaluations and end up in the storage directory
+    snapshot_enabled = config.Snapshot.enabled
+    config.Snapshot.enabled = False
+    try:
+        for size in sizes:
+            queried = getQueriedDevices(size)
+            variants = [changeStates(queried, 0.1) for _ in range(repeat)]
+
+            def initial():
+                monitor = Monitor(DeviceManager(), FakeClient(), bridge_id)
+                monitor._Monitor__evaluate(queried)
+
+            monitor = Monitor(DeviceManager(), FakeClient(), bridge_id)
+            monitor._Monitor__evaluate(queried)
+            devices = monitor._Monitor__devices()
+            cases = {
+                "evaluate_initial": initial,
+                "diff_unchanged": lambda: monitor._Monitor__diff(devices.keys(), queried),
+                "evaluate_unchanged": lambda: monitor._Monitor__evaluate(queried),
+                # every run applies a different set of state changes to the baseline
+                "evaluate_state_changes": lambda: monitor._Monitor__evaluate(variants.pop())
+            }
+            setups = {"evaluate_state_changes": lambda: monitor._Monitor__evaluate(queried)}
+            for name, case in cases.items():
+                best = measure(case, repeat, setups.get(name))
+                results["{}_{}".format(name, size)] = {"count": size, "total_s": best, "per_item_us": best / size * 1e6}
+    finally:
+        config.Snapshot.enabled = snapshot_enabled
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{:<28} {:>12.3f} ms {:>10.3f} us/item".format(name, result["total_s"] * 1e3, result["per_item_us"]))
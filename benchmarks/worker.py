@@ -0,0 +1,89 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# run from the repository root: python -m benchmarks.worker
+
+
+from benchmarks.fakes import FakeClient, FakeCommand, setupBridge, getDevices, bridge_id
+from hue_bridge.controller import Worker
+from hue_bridge.scheduler import DeadlineScheduler
+from hue_bridge.types.service import SetColor, GetStatus
+import time, json, random, timeit
+
+
+def getCommands(devices: list, count: int) -> list:
+    commands = list()
+    for number in range(count):
+        device = devices[number % len(devices)]
+        kind = number % 4
+        if kind == 0:
+            data = {"hue": random.randint(0, 360), "saturation": random.randint(0, 100), "brightness": random.randint(1, 100), "duration": 0.5}
+            commands.append(FakeCommand(device.id, "setColor", data))
+        elif kind == 1:
+            commands.append(FakeCommand(device.id, "setBrightness", {"brightness": random.randint(0, 100), "duration": 0.5}))
+        elif kind == 2:
+            commands.append(FakeCommand(device.id, "setPower", {"power": bool(number % 8)}))
+        else:
+            commands.append(FakeCommand(device.id, "getStatus"))
+    return commands
+
+
+def runWorker(client: FakeClient, scheduler: DeadlineScheduler, devices: dict, commands: list) -> float:
+    client.expect(len(commands))
+    start = time.perf_counter()
+    for command in commands:
+        scheduler.put(devices[command.device_id], command)
+    if not client.wait(60):
+        raise RuntimeError("worker did not answer all commands")
+    return time.perf_counter() - start
+
+
+def run(count: int = 5000, repeat: int = 5) -> dict:
+    random.seed(0)
+    setupBridge()
+    results = dict()
+    # workers can't be stopped, one worker serves all runs so idle threads don't pile up
+    client = FakeClient()
+    scheduler = DeadlineScheduler()
+    Worker(0, client, bridge_id, scheduler).start()
+    # one command per device measures the plain path, a burst for a single device measures coalescing
+    for name, device_count in (("worker_distinct_devices", count), ("worker_single_device_burst", 1)):
+        devices = getDevices(device_count)
+        device_map = {device.id: device for device in devices}
+        # workers replace the command message with the response, every run needs new commands
+        best = min(runWorker(client, scheduler, device_map, getCommands(devices, count)) for _ in range(repeat))
+        results[name] = {"count": count, "total_s": best, "per_item_us": best / count * 1e6}
+    # cost of the single stages of a command
+    device = getDevices(1)[0]
+    data = json.dumps({"hue": 120, "saturation": 80, "brightness": 60, "duration": 0.5})
+    kwargs = json.loads(data)
+    state = device.state
+    stages = {
+        "stage_json_decode": lambda: json.loads(data),
+        "stage_service_lookup": lambda: device.getServiceType("setColor"),
+        "stage_set_color_body": lambda: SetColor.body(device, **kwargs),
+        "stage_get_status_payload": lambda: GetStatus.payload(device, False, state),
+        "stage_json_encode": lambda: json.dumps({"status": 0})
+    }
+    for name, case in stages.items():
+        best = min(timeit.repeat(case, number=count, repeat=repeat))
+        results[name] = {"count": count, "total_s": best, "per_item_us": best / count * 1e6}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{:<28} {:>10.3f} us/item".format(name, result["per_item_us"]))
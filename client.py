@@ -16,41 +16,28 @@
 
 
 from hue_bridge.configuration import config
-from hue_bridge.discovery import discoverBridge
-from hue_bridge.device_manager import DeviceManager
-from hue_bridge.monitor import Monitor
-from hue_bridge.controller import Controller
+from hue_bridge.bridges import loadBridges
+from hue_bridge.connector import Connector
+from hue_bridge.metrics import startMetricsServer
 import time, random, cc_lib
 
 
-if config.RuntimeEnv.max_start_delay > 0:
-    delay = random.randint(1, config.RuntimeEnv.max_start_delay)
-    print("delaying start for {}s".format(delay))
-    time.sleep(delay)
-
-
-device_manager = DeviceManager()
-
-
-def on_connect(client: cc_lib.client.Client):
-    devices = device_manager.devices
-    for device in devices.values():
-        try:
-            if device.state["reachable"]:
-                client.connectDevice(device, asynchronous=True)
-        except cc_lib.client.DeviceConnectError:
-            pass
+connector_client = cc_lib.client.Client()
 
+connector = Connector(connector_client, loadBridges())
 
-connector_client = cc_lib.client.Client()
-connector_client.setConnectClbk(on_connect)
+connector_client.setConnectClbk(connector.onConnect)
 
-bridge_monitor = Monitor(device_manager, connector_client, config.Bridge.id)
-bridge_controller = Controller(device_manager, connector_client, config.Bridge.id)
+# a warm start serves commands from the snapshot right away, the delay only spreads cold starts
+if config.RuntimeEnv.max_start_delay > 0 and not connector.device_manager.devices:
+    delay = random.randint(1, config.RuntimeEnv.max_start_delay)
+    print("delaying start for {}s".format(delay))
+    time.sleep(delay)
 
 
 if __name__ == '__main__':
-    discoverBridge()
+    startMetricsServer()
+    connector.discover()
     while True:
         try:
             connector_client.initHub()
@@ -58,10 +45,8 @@ if __name__ == '__main__':
         except cc_lib.client.HubInitializationError:
             time.sleep(10)
     connector_client.connect(reconnect=True)
-    bridge_monitor.start()
-    bridge_controller.start()
+    connector.start()
     try:
-        bridge_monitor.join()
-        bridge_controller.join()
+        connector.join()
     except KeyboardInterrupt:
         print("\ninterrupted by user\n")
@@ -0,0 +1,246 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .device_manager import DeviceManager
+from .transport import getTransport
+from .async_transport import AsyncTransport
+from .state_cache import state_cache
+from .types.service import updateState, mergeStates
+from .metrics import command_wait, commands_dropped, commands_failed, registerQueueDepths, bindService, unbindService
+from . import metrics
+from .tracing import tracer
+from .resilience import bindDeadline, unbindDeadline
+from threading import Thread
+from functools import partial
+import time, json, asyncio, contextvars, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class AsyncWorker:
+    def __init__(self, device, client: cc_lib.client.Client, transport: AsyncTransport):
+        self.name = "worker-{}".format(device.id)
+        self.__device = device
+        self.__client = client
+        self.__transport = transport
+        self.__command_queue = asyncio.Queue()
+        self.__handled = set()
+        self.__task = asyncio.ensure_future(self.run())
+
+    async def run(self) -> None:
+        logger.debug("'{}': starting ...".format(self.name))
+        try:
+            while True:
+                commands = [await self.__command_queue.get()]
+                while not self.__command_queue.empty():
+                    commands.append(self.__command_queue.get_nowait())
+                self.__handled.clear()
+                try:
+                    await self.__process(commands)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    logger.error("{}: could not process commands - {}".format(self.name, ex))
+                    self.__fail(commands)
+        except asyncio.CancelledError:
+            logger.debug("'{}': quit".format(self.name))
+
+    def __fail(self, commands: list):
+        # answers what the failed batch left unanswered, the task keeps serving the device
+        for command in commands:
+            if id(command) in self.__handled:
+                continue
+            try:
+                commands_failed.inc(command.service_uri)
+                self.__respond(command, cc_lib.client.message.Message(json.dumps({"status": 1})))
+            except Exception as ex:
+                logger.error("{}: could not fail '{}' - {}".format(self.name, command, ex))
+
+    async def __process(self, commands: list):
+        pending = list()
+        for command in commands:
+            if time.time() - command.timestamp > config.Controller.max_command_age:
+                logger.warning(
+                    "{}: dropped command - max age exceeded - correlation id: {}".format(
+                        self.name,
+                        command.correlation_id
+                    )
+                )
+                commands_dropped.inc("max_age")
+                tracer.finish(command, "dropped")
+                self.__handled.add(id(command))
+                continue
+            logger.debug("{}: '{}'".format(self.name, command))
+            tracer.mark(command, "dequeued")
+            try:
+                kwargs = json.loads(command.message.data) if command.message.data else dict()
+                service = self.__device.getServiceType(command.service_uri)
+                if hasattr(service, "body"):
+                    pending.append((command, service, service.body(self.__device, **kwargs)))
+                    tracer.mark(command, "decoded")
+                    continue
+                await self.__flush(pending)
+                pending = list()
+                tracer.mark(command, "decoded")
+                command_wait.observe(time.time() - command.timestamp, command.service_uri)
+                token = tracer.bind((command,))
+                deadline = bindDeadline((command,))
+                service_token = bindService((command,))
+                try:
+                    if hasattr(service, "payload"):
+                        data = service.payload(self.__device, *(await self.__getState()))
+                    else:
+                        # executor threads don't inherit the context, the copy carries the bound traces
+                        data = await asyncio.get_running_loop().run_in_executor(
+                            None,
+                            partial(contextvars.copy_context().run, service.task, self.__device, **kwargs)
+                        )
+                finally:
+                    unbindService(service_token)
+                    unbindDeadline(deadline)
+                    tracer.unbind(token)
+                cmd_resp = cc_lib.client.message.Message(json.dumps(data))
+            except json.JSONDecodeError as ex:
+                logger.error("{}: could not parse command data - {}".format(self.name, ex))
+                commands_failed.inc(command.service_uri)
+                cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
+            except TypeError as ex:
+                logger.error("{}: could not parse command response data - {}".format(self.name, ex))
+                commands_failed.inc(command.service_uri)
+                cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
+            self.__respond(command, cmd_resp)
+        await self.__flush(pending)
+
+    async def __getState(self):
+        if state_cache.isFresh(self.__device.bridge_id, self.__device):
+            return False, self.__device.state
+        err, body = await self.__transport.getLight(self.__device.number)
+        if not err:
+            self.__device.state = body
+            return err, self.__device.state
+        return err, body
+
+    async def __flush(self, pending: list):
+        if not pending:
+            return
+        if len(pending) > 1:
+            logger.debug("{}: coalesced {} commands".format(self.name, len(pending)))
+        data = mergeStates(body for _, _, body in pending)
+        if metrics.enabled:
+            now = time.time()
+            for command, _, _ in pending:
+                command_wait.observe(now - command.timestamp, command.service_uri)
+        token = tracer.bind(command for command, _, _ in pending)
+        deadline = bindDeadline(command for command, _, _ in pending)
+        service_token = bindService(command for command, _, _ in pending)
+        try:
+            err, body = await self.__transport.putLightState(self.__device.number, data)
+        finally:
+            unbindService(service_token)
+            unbindDeadline(deadline)
+            tracer.unbind(token)
+        if err:
+            logger.error("'{}' for '{}' failed - {}".format(pending[-1][1].__name__, self.__device.id, body))
+        else:
+            updateState(self.__device, data)
+        data = json.dumps({"status": int(err)})
+        for command, _, _ in pending:
+            self.__respond(command, cc_lib.client.message.Message(data))
+
+    def __respond(self, command, cmd_resp):
+        self.__handled.add(id(command))
+        command.message = cmd_resp
+        logger.debug("{}: '{}'".format(self.name, command))
+        if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
+            tracer.mark(command, "responding")
+            self.__client.sendResponse(command, asynchronous=True)
+        tracer.finish(command)
+
+    def stop(self):
+        self.__task.cancel()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__command_queue.qsize()
+
+    def execute(self, command):
+        self.__command_queue.put_nowait(command)
+
+
+class AsyncController(Thread):
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, bridge_id: str):
+        super().__init__(name="controller-{}".format(bridge_id), daemon=True)
+        self.__device_manager = device_manager
+        self.__client = client
+        self.__bridge_id = bridge_id
+        self.__worker_pool = dict()
+
+    def run(self):
+        logger.info("starting '{}' ...".format(self.name))
+        if metrics.enabled:
+            registerQueueDepths(self.name, lambda: self.queue_depths)
+        asyncio.run(self.__run())
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        async_transport = AsyncTransport(getTransport(self.__bridge_id))
+        garbage_collector_time = time.time()
+        try:
+            while True:
+                try:
+                    # the client only offers a blocking receive, keep it off the event loop
+                    command = await loop.run_in_executor(None, partial(self.__client.receiveCommand, timeout=30))
+                    tracer.begin(command)
+                    try:
+                        device = self.__device_manager.get(command.device_id)
+                        if not device.id in self.__worker_pool:
+                            self.__worker_pool[device.id] = AsyncWorker(device, self.__client, async_transport)
+                        self.__worker_pool[device.id].execute(command)
+                        tracer.mark(command, "queued")
+                    except KeyError:
+                        logger.error("received command for unknown device '{}'".format(command.device_id))
+                        commands_dropped.inc("unknown_device")
+                        tracer.finish(command, "unknown_device")
+                except cc_lib.client.CommandQueueEmptyError:
+                    if time.time() - garbage_collector_time > 120:
+                        self.__collectGarbage()
+                        garbage_collector_time = time.time()
+        finally:
+            await async_transport.close()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(worker.queue_depth for worker in list(self.__worker_pool.values()))
+
+    @property
+    def queue_depths(self) -> dict:
+        return {device_id: worker.queue_depth for device_id, worker in list(self.__worker_pool.items())}
+
+    def __collectGarbage(self):
+        garbage_workers = set(self.__worker_pool) - set(self.__device_manager.devices)
+        for worker_id in garbage_workers:
+            worker = self.__worker_pool[worker_id]
+            logger.debug("stopping '{}'".format(worker.name))
+            worker.stop()
+            del self.__worker_pool[worker_id]
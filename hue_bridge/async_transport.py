@@ -0,0 +1,97 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .transport import Transport, createSSLContext
+from .types.service import evaluatePutResponse, evaluateGetResponse
+from .metrics import bridge_round_trip, bridge_errors, bridge_retries, current_service
+from .resilience import getDeadline, getBackoff, isRetryable
+from .tracing import tracer
+import time, asyncio, aiohttp
+
+
+class AsyncTransport:
+    # must be created and used inside the event loop that owns it, urls are taken from the shared
+    # transport on every request so host changes found by discovery apply right away
+    def __init__(self, transport: Transport):
+        self.__bridge_id = transport.bridge_id
+        self.__transport = transport
+        self.__rate_limiter = transport.rate_limiter
+        self.__breaker = transport.breaker
+        self.__session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.Bridge.pool_size, ssl=createSSLContext()),
+            timeout=aiohttp.ClientTimeout(sock_connect=config.Bridge.connect_timeout, sock_read=config.Bridge.read_timeout)
+        )
+
+    async def __request(self, operation: str, request, evaluate):
+        # same retry policy as the threaded engine, see resilience.callWithRetry
+        deadline = getDeadline()
+        attempt = 0
+        err, body = True, "hue bridge unavailable"
+        while True:
+            if not self.__breaker.allow():
+                break
+            tracer.markCurrent("bridge_request")
+            start = time.perf_counter()
+            try:
+                async with request() as resp:
+                    payload = await resp.json(content_type=None) if resp.status == 200 else None
+                    err, body = evaluate(resp.status, payload)
+                    retry = err and isRetryable(resp.status, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                err, body, retry = True, "could not send request to hue bridge", True
+            except ValueError:
+                err, body, retry = True, "could not send request to hue bridge", False
+            bridge_round_trip.observe(time.perf_counter() - start, self.__bridge_id, operation, current_service.get())
+            tracer.markCurrent("bridge_response")
+            if not retry:
+                self.__breaker.success()
+                break
+            self.__breaker.failure()
+            attempt += 1
+            backoff = getBackoff(attempt)
+            if attempt >= config.Resilience.max_attempts or time.time() + backoff >= deadline:
+                break
+            bridge_retries.inc(self.__bridge_id, operation)
+            await asyncio.sleep(backoff)
+        if err:
+            bridge_errors.inc(self.__bridge_id, operation)
+        return err, body
+
+    async def putLightState(self, number: str, data: dict):
+        wait = self.__rate_limiter.light.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return await self.__request(
+            "put_light",
+            lambda: self.__session.put(self.__transport.light_state_url.format(number), json=data),
+            evaluatePutResponse
+        )
+
+    async def getLight(self, number: str):
+        return await self.__request(
+            "get_light",
+            lambda: self.__session.get(self.__transport.light_url.format(number)),
+            evaluateGetResponse
+        )
+
+    async def close(self):
+        await self.__session.close()
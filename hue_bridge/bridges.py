@@ -0,0 +1,86 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config, user_dir
+from .logger import root_logger
+from collections import OrderedDict
+from threading import Lock
+from os.path import join as path_join
+import json
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+bridges_path = path_join(user_dir, "bridges.json")
+
+
+class BridgeInfo:
+    def __init__(self, id: str, api_key: str, host: str = None):
+        self.id = id
+        self.api_key = api_key
+        self.__host = host
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @host.setter
+    def host(self, host: str):
+        self.__host = host
+        # the address of the configured bridge is persisted in the config file
+        if self.id == config.Bridge.id and config.Bridge.host != host:
+            config.Bridge.host = host
+
+
+bridge_pool = OrderedDict()
+bridge_pool_lock = Lock()
+
+
+def loadBridges() -> list:
+    # the configured bridge comes first, additional bridges are listed in 'bridges.json'
+    # as [{"id": "...", "api_key": "...", "host": "..."}, ...] with an optional host
+    with bridge_pool_lock:
+        bridge_pool.clear()
+        bridge_pool[config.Bridge.id] = BridgeInfo(config.Bridge.id, config.Bridge.api_key, config.Bridge.host)
+        try:
+            with open(bridges_path) as file:
+                entries = json.load(file)
+            for entry in entries:
+                try:
+                    bridge_id = entry["id"].upper()
+                    if bridge_id in bridge_pool:
+                        logger.warning("skipping duplicate bridge '{}'".format(bridge_id))
+                        continue
+                    bridge_pool[bridge_id] = BridgeInfo(bridge_id, entry["api_key"], entry.get("host"))
+                except (KeyError, TypeError, AttributeError) as ex:
+                    logger.error("could not load bridge '{}' - {}".format(entry, ex))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as ex:
+            logger.error("could not load '{}' - {}".format(bridges_path, ex))
+        return list(bridge_pool.values())
+
+
+def getBridge(bridge_id: str) -> BridgeInfo:
+    with bridge_pool_lock:
+        if bridge_id not in bridge_pool and bridge_id == config.Bridge.id:
+            bridge_pool[bridge_id] = BridgeInfo(config.Bridge.id, config.Bridge.api_key, config.Bridge.host)
+        return bridge_pool[bridge_id]
@@ -0,0 +1,199 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from threading import Lock
+from typing import Tuple
+import numpy, colorsys
+
+
+# conversion constants and gamut handling follow rgbxy, so the batch functions match the per-call
+# path, the lookup tables of ColorEngine are approximations (see hsbToXY)
+
+xy_step = 0.002
+
+rgb_to_xyz = numpy.array(
+    (
+        (0.664511, 0.154324, 0.162028),
+        (0.283881, 0.668433, 0.047685),
+        (0.000088, 0.072310, 0.986039)
+    )
+)
+
+xyz_to_rgb = numpy.array(
+    (
+        (1.656492, -0.354851, -0.255038),
+        (-0.707196, 1.655397, 0.036152),
+        (0.051713, -0.121364, 1.011530)
+    )
+)
+
+
+def convertHSBToRGB(hue, sat, bri):
+    # scalar reference used before the vectorized conversion, kept for comparisons
+    return tuple(round(val * 255) for val in colorsys.hsv_to_rgb(hue / 360, sat / 100, bri / 100))
+
+
+def convertRGBToHSB(red, green, blue):
+    hue, saturation, brightness = colorsys.rgb_to_hsv(red / 255, green / 255, blue / 255)
+    return (round(hue * 360), round(saturation * 100), round(brightness * 100))
+
+
+def hsbToRGB(hue, saturation, brightness) -> numpy.ndarray:
+    hue = numpy.asarray(hue, dtype=float) / 360
+    saturation = numpy.asarray(saturation, dtype=float) / 100
+    value = numpy.asarray(brightness, dtype=float) / 100
+    hue, saturation, value = numpy.broadcast_arrays(hue, saturation, value)
+    sector = numpy.floor(hue * 6.0)
+    fraction = hue * 6.0 - sector
+    sector = sector.astype(int) % 6
+    p = value * (1.0 - saturation)
+    q = value * (1.0 - saturation * fraction)
+    t = value * (1.0 - saturation * (1.0 - fraction))
+    red = numpy.choose(sector, (value, q, p, p, t, value))
+    green = numpy.choose(sector, (t, value, value, q, p, p))
+    blue = numpy.choose(sector, (p, p, t, value, value, q))
+    return numpy.round(numpy.stack((red, green, blue), axis=-1) * 255)
+
+
+def rgbToHSB(rgb) -> numpy.ndarray:
+    rgb = numpy.asarray(rgb, dtype=float) / 255
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    max_c = rgb.max(axis=-1)
+    min_c = rgb.min(axis=-1)
+    delta = max_c - min_c
+    grey = delta == 0
+    safe_delta = numpy.where(grey, 1.0, delta)
+    saturation = numpy.where(max_c > 0, delta / numpy.where(max_c > 0, max_c, 1.0), 0.0)
+    red_c = (max_c - red) / safe_delta
+    green_c = (max_c - green) / safe_delta
+    blue_c = (max_c - blue) / safe_delta
+    hue = numpy.where(
+        red == max_c,
+        blue_c - green_c,
+        numpy.where(green == max_c, 2.0 + red_c - blue_c, 4.0 + green_c - red_c)
+    )
+    hue = numpy.where(grey, 0.0, (hue / 6.0) % 1.0)
+    saturation = numpy.where(grey, 0.0, saturation)
+    return numpy.stack((numpy.round(hue * 360), numpy.round(saturation * 100), numpy.round(max_c * 100)), axis=-1)
+
+
+def closestOnSegment(start, end, points):
+    segment = end - start
+    factor = numpy.clip(((points - start) @ segment) / (segment @ segment), 0.0, 1.0)
+    return start + factor[..., None] * segment
+
+
+def clampToGamut(xy, gamut) -> numpy.ndarray:
+    red, lime, blue = gamut
+    v1 = lime - red
+    v2 = blue - red
+    q = xy - red
+    denominator = v1[0] * v2[1] - v1[1] * v2[0]
+    s = (q[..., 0] * v2[1] - q[..., 1] * v2[0]) / denominator
+    t = (v1[0] * q[..., 1] - v1[1] * q[..., 0]) / denominator
+    inside = (s >= 0.0) & (t >= 0.0) & (s + t <= 1.0)
+    candidates = numpy.stack(
+        (closestOnSegment(red, lime, xy), closestOnSegment(blue, red, xy), closestOnSegment(lime, blue, xy)),
+        axis=-2
+    )
+    distances = ((candidates - xy[..., None, :]) ** 2).sum(axis=-1)
+    closest = numpy.take_along_axis(candidates, distances.argmin(axis=-1)[..., None, None], axis=-2)[..., 0, :]
+    return numpy.where(inside[..., None], xy, closest)
+
+
+def rgbToXY(rgb, gamut) -> numpy.ndarray:
+    rgb = numpy.asarray(rgb, dtype=float) / 255
+    rgb = numpy.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = rgb @ rgb_to_xyz.T
+    total = xyz.sum(axis=-1)
+    total = numpy.where(total == 0, 1.0, total)
+    xy = numpy.stack((xyz[..., 0] / total, xyz[..., 1] / total), axis=-1)
+    return clampToGamut(xy, gamut)
+
+
+def xyToRGB(xy, gamut) -> numpy.ndarray:
+    xy = clampToGamut(numpy.asarray(xy, dtype=float), gamut)
+    x, y = xy[..., 0], xy[..., 1]
+    xyz = numpy.stack((x / y, numpy.ones_like(x), (1.0 - x - y) / y), axis=-1)
+    rgb = xyz @ xyz_to_rgb.T
+    rgb = numpy.where(rgb <= 0.0031308, 12.92 * rgb, 1.055 * numpy.power(numpy.abs(rgb), 1.0 / 2.4) - 0.055)
+    rgb = numpy.maximum(rgb, 0.0)
+    max_c = rgb.max(axis=-1, keepdims=True)
+    rgb = numpy.where(max_c > 1.0, rgb / numpy.where(max_c > 1.0, max_c, 1.0), rgb)
+    return numpy.floor(rgb * 255)
+
+
+class ColorEngine:
+    def __init__(self, gamut):
+        self.__gamut = numpy.asarray(gamut, dtype=float)
+        self.__lock = Lock()
+        self.__hsb_lut = None
+        self.__xy_lut = None
+
+    def hsbToXYBatch(self, hue, saturation, brightness) -> numpy.ndarray:
+        return rgbToXY(hsbToRGB(hue, saturation, brightness), self.__gamut)
+
+    def xyToHSBBatch(self, xy) -> numpy.ndarray:
+        return rgbToHSB(xyToRGB(xy, self.__gamut))
+
+    def __buildHSBTable(self):
+        # chromaticity hardly depends on brightness, so one table at full brightness covers all
+        hue, saturation = numpy.meshgrid(numpy.arange(361), numpy.arange(101), indexing="ij")
+        return self.hsbToXYBatch(hue, saturation, 100).astype(numpy.float32)
+
+    def __buildXYTable(self):
+        steps = int(round(1 / xy_step)) + 1
+        x, y = numpy.meshgrid(numpy.linspace(0, 1, steps), numpy.linspace(0, 1, steps), indexing="ij")
+        return self.xyToHSBBatch(numpy.stack((x, y), axis=-1)).astype(numpy.uint16)
+
+    def hsbToXY(self, hue, saturation, brightness) -> Tuple[float, float]:
+        # brightness is ignored, the table holds the chromaticity at full brightness and the bridge
+        # gets brightness as 'bri', results deviate slightly from hsbToXYBatch for dark colors
+        if self.__hsb_lut is None:
+            with self.__lock:
+                if self.__hsb_lut is None:
+                    self.__hsb_lut = self.__buildHSBTable()
+        x, y = self.__hsb_lut[min(max(int(round(hue)), 0), 360), min(max(int(round(saturation)), 0), 100)]
+        return round(float(x), 4), round(float(y), 4)
+
+    def xyToHSB(self, x, y) -> Tuple[int, int, int]:
+        if self.__xy_lut is None:
+            with self.__lock:
+                if self.__xy_lut is None:
+                    self.__xy_lut = self.__buildXYTable()
+        last = self.__xy_lut.shape[0] - 1
+        hsb = self.__xy_lut[
+            min(max(int(round(x / xy_step)), 0), last),
+            min(max(int(round(y / xy_step)), 0), last)
+        ]
+        return int(hsb[0]), int(hsb[1]), int(hsb[2])
+
+
+engine_pool = dict()
+engine_pool_lock = Lock()
+
+
+def getColorEngine(gamut) -> ColorEngine:
+    key = tuple(tuple(round(float(val), 4) for val in point) for point in gamut)
+    with engine_pool_lock:
+        if key not in engine_pool:
+            engine_pool[key] = ColorEngine(key)
+        return engine_pool[key]
@@ -40,11 +40,45 @@ class HueConf:
         api_path = "api"
         api_key = None
         id = None
-        delay = 0.25
+        light_rate = 10.0
+        light_burst = 5
+        group_rate = 1.0
+        group_burst = 1
+        pool_size = 4
+        connect_timeout = 3.0
+        read_timeout = 10.0
+
+    @section
+    class Monitor:
+        mode = "stream"
+        poll_interval = 10
+        min_poll_interval = 2
+        max_poll_interval = 60
+        stream_url = None
+        stream_timeout = 120.0
+        resync_interval = 300
+        stream_retry = 300
+        stream_min_duration = 10.0
+        stream_reconnect_delay = 5.0
+
+    @section
+    class Events:
+        enabled = True
+        min_interval = 1.0
+
+    @section
+    class Snapshot:
+        enabled = True
+        interval = 30
 
     @section
     class Discovery:
         nupnp = "https://discovery.meethue.com/"
+        mdns = True
+        mdns_timeout = 5.0
+        subnet = None
+        scan_concurrency = 64
+        probe_timeout = 1.0
 
     @section
     class Senergy:
@@ -58,7 +92,43 @@ class HueConf:
 
     @section
     class Controller:
+        engine = "threads"
+        workers = 0
         max_command_age = 180
+        max_state_age = 5.0
+        fan_out_window = 0.05
+        fan_out_min = 3
+        fan_out_groups = 16
+        fairness_window = 1.0
+
+    @section
+    class Metrics:
+        enabled = False
+        host = "127.0.0.1"
+        port = 9108
+
+    @section
+    class Tracing:
+        enabled = False
+        sample_rate = 0.01
+        buffer_size = 1000
+        file = None
+
+    @section
+    class Supervisor:
+        shards = 0
+        heartbeat = 10
+        restart_delay = 5
+        max_restart_delay = 300
+
+    @section
+    class Resilience:
+        max_attempts = 4
+        base_backoff = 0.25
+        max_backoff = 5.0
+        default_budget = 10.0
+        failure_threshold = 5
+        reset_timeout = 15.0
 
 
 if not path_exists(user_dir):
@@ -0,0 +1,125 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .discovery import discoverBridge, startMDNSListener
+from .device_manager import DeviceManager
+from .monitor import Monitor, HubSync
+from .controller import Controller
+from .router import CommandRouter
+from .snapshot import DeviceSnapshot
+from threading import Thread, Event
+import cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class Connector:
+    # monitors and controllers for a set of bridges that share one client and hub
+    def __init__(self, client: cc_lib.client.Client, bridges: list):
+        self.__client = client
+        self.__bridges = list(bridges)
+        self.__device_manager = DeviceManager()
+        if config.Snapshot.enabled:
+            for bridge in self.__bridges:
+                self.__device_manager.addMany(DeviceSnapshot(bridge.id).load())
+            if self.__device_manager.devices:
+                logger.info("restored {} devices from snapshot".format(len(self.__device_manager.devices)))
+        # with more than one bridge a router receives the commands and hands them to the controller of the device's bridge
+        self.__command_router = CommandRouter(self.__device_manager, client) if len(self.__bridges) > 1 else None
+        hub_sync = HubSync(self.__device_manager, client, (bridge.id for bridge in self.__bridges))
+        self.__monitors = list()
+        self.__controllers = list()
+        self.__discoveries = list()
+        self.__started = Event()
+        for bridge in self.__bridges:
+            bridge_client = self.__command_router.getClient(bridge.id) if self.__command_router else client
+            self.__monitors.append(Monitor(self.__device_manager, bridge_client, bridge.id, hub_sync))
+            if config.Controller.engine == "asyncio":
+                from .async_controller import AsyncController
+                self.__controllers.append(AsyncController(self.__device_manager, bridge_client, bridge.id))
+            else:
+                self.__controllers.append(Controller(self.__device_manager, bridge_client, bridge.id))
+
+    def discover(self):
+        # discovery retries until the bridge is found, so every bridge starts on its own and an
+        # offline bridge doesn't hold back the others
+        self.__discoveries = [
+            Thread(
+                target=self.__discoverAndStart,
+                name="discovery-{}".format(bridge.id),
+                args=(bridge.id, monitor, controller),
+                daemon=True
+            )
+            for bridge, monitor, controller in zip(self.__bridges, self.__monitors, self.__controllers)
+        ]
+        for thread in self.__discoveries:
+            thread.start()
+
+    def __discoverAndStart(self, bridge_id: str, monitor: Monitor, controller):
+        discoverBridge(bridge_id)
+        startMDNSListener(bridge_id)
+        self.__started.wait()
+        logger.info("starting bridge '{}' ...".format(bridge_id))
+        monitor.start()
+        controller.start()
+
+    def onConnect(self, client: cc_lib.client.Client):
+        for device in self.__device_manager.devices.values():
+            try:
+                if device.state.reachable:
+                    client.connectDevice(device, asynchronous=True)
+            except cc_lib.client.DeviceConnectError:
+                pass
+
+    def start(self):
+        # monitors and controllers start once the client is up and their bridge has been discovered
+        if not self.__discoveries:
+            self.discover()
+        if self.__command_router:
+            self.__command_router.start()
+        self.__started.set()
+
+    def join(self):
+        for thread in self.__discoveries:
+            thread.join()
+        for monitor in self.__monitors:
+            monitor.join()
+        for controller in self.__controllers:
+            controller.join()
+
+    @property
+    def device_manager(self) -> DeviceManager:
+        return self.__device_manager
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(controller.queue_depth for controller in self.__controllers)
+
+    @property
+    def poll_intervals(self) -> dict:
+        return {monitor.name: monitor.poll_interval for monitor in self.__monitors}
+
+    @property
+    def breaker_states(self) -> dict:
+        return {monitor.name: monitor.breaker_state for monitor in self.__monitors}
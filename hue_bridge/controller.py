@@ -22,64 +22,164 @@ if __name__ == '__main__':
 from .configuration import config
 from .logger import root_logger
 from .device_manager import DeviceManager
+from .transport import getTransport
+from .fan_out import GroupAction, GroupDispatcher
+from .scheduler import DeadlineScheduler
+from .types.service import putState, mergeStates
+from .metrics import command_wait, commands_dropped, commands_failed, registerQueueDepths, bindService, unbindService
+from . import metrics
+from .tracing import tracer
+from .resilience import bindDeadline, unbindDeadline
 from threading import Thread
-from queue import Queue, Empty
-import time, json, cc_lib
+from collections import Counter
+import os, time, json, cc_lib
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
+def getWorkerCount() -> int:
+    # workers mostly wait for the bridge, a few per core suffice and more than the
+    # burst budget would only queue up in front of the rate limiter
+    if config.Controller.workers > 0:
+        return config.Controller.workers
+    return max(2, min((os.cpu_count() or 1) * 2, config.Bridge.light_burst * 2))
+
+
 class Worker(Thread):
-    def __init__(self, device, client: cc_lib.client.Client):
-        super().__init__(name="worker-{}".format(device.id), daemon=True)
-        self.__device = device
+    def __init__(self, number: int, client: cc_lib.client.Client, bridge_id: str, scheduler: DeadlineScheduler):
+        super().__init__(name="worker-{}-{}".format(bridge_id, number), daemon=True)
         self.__client = client
-        self.__stop = False
-        self.__command_queue = Queue()
+        self.__scheduler = scheduler
+        self.__handled = set()
 
     def run(self) -> None:
         logger.debug("'{}': starting ...".format(self.name))
-        while not self.__stop:
+        while True:
+            device, items = self.__scheduler.take()
+            remaining, action = list(), None
+            self.__handled.clear()
+            try:
+                remaining, action = self.__process(device, items)
+            except Exception as ex:
+                logger.error("{}: could not process commands for '{}' - {}".format(self.name, device.id, ex))
+                self.__fail(items)
+            finally:
+                self.__scheduler.release(device, remaining, action)
+
+    def __fail(self, items: list):
+        # answers what the failed turn left unanswered and arrives at group actions so their groups don't stall
+        for item in items:
+            if id(item) in self.__handled:
+                continue
             try:
-                command: cc_lib.client.message.CommandEnvelope = self.__command_queue.get(timeout=30)
-                if time.time() - command.timestamp <= config.Controller.max_command_age:
-                    logger.debug("{}: '{}'".format(self.name, command))
-                    try:
-                        if command.message.data:
-                            data = self.__device.getService(command.service_uri, **json.loads(command.message.data))
-                        else:
-                            data = self.__device.getService(command.service_uri)
-                        cmd_resp = cc_lib.client.message.Message(json.dumps(data))
-                    except json.JSONDecodeError as ex:
-                        logger.error("{}: could not parse command data - {}".format(self.name, ex))
-                        cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
-                    except TypeError as ex:
-                        logger.error("{}: could not parse command response data - {}".format(self.name, ex))
-                        cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
-                    command.message = cmd_resp
-                    logger.debug("{}: '{}'".format(self.name, command))
-                    if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
-                        self.__client.sendResponse(command, asynchronous=True)
+                if isinstance(item, GroupAction):
+                    item.arrive()
                 else:
-                    logger.warning(
-                        "{}: dropped command - max age exceeded - correlation id: {}".format(
-                            self.name,
-                            command.correlation_id
-                        )
+                    commands_failed.inc(item.service_uri)
+                    self.__respond(item, cc_lib.client.message.Message(json.dumps({"status": 1})))
+            except Exception as ex:
+                logger.error("{}: could not fail '{}' - {}".format(self.name, item, ex))
+
+    def __process(self, device, items: list):
+        # serves one turn of a device, that is one bridge request, and returns the unprocessed
+        # items together with the group action they have to wait for
+        pending = list()
+        for index, command in enumerate(items):
+            if isinstance(command, GroupAction):
+                if pending:
+                    self.__flush(device, pending)
+                    return items[index:], None
+                command.arrive()
+                self.__handled.add(id(command))
+                if not command.done.is_set():
+                    return items[index + 1:], command
+                continue
+            if time.time() - command.timestamp > config.Controller.max_command_age:
+                logger.warning(
+                    "{}: dropped command - max age exceeded - correlation id: {}".format(
+                        self.name,
+                        command.correlation_id
                     )
-            except Empty:
-                pass
-        del self.__device
-        del self.__client
-        del self.__command_queue
-        logger.debug("'{}': quit".format(self.name))
+                )
+                commands_dropped.inc("max_age")
+                tracer.finish(command, "dropped")
+                self.__handled.add(id(command))
+                continue
+            logger.debug("{}: '{}'".format(self.name, command))
+            tracer.mark(command, "dequeued")
+            try:
+                kwargs = json.loads(command.message.data) if command.message.data else dict()
+                service = device.getServiceType(command.service_uri)
+                if hasattr(service, "body"):
+                    pending.append((command, service, service.body(device, **kwargs)))
+                    tracer.mark(command, "decoded")
+                    continue
+                if pending:
+                    self.__flush(device, pending)
+                    return items[index:], None
+                tracer.mark(command, "decoded")
+                command_wait.observe(time.time() - command.timestamp, command.service_uri)
+                token = tracer.bind((command,))
+                deadline = bindDeadline((command,))
+                service_token = bindService((command,))
+                try:
+                    data = service.task(device, **kwargs)
+                finally:
+                    unbindService(service_token)
+                    unbindDeadline(deadline)
+                    tracer.unbind(token)
+                cmd_resp = cc_lib.client.message.Message(json.dumps(data))
+            except json.JSONDecodeError as ex:
+                logger.error("{}: could not parse command data - {}".format(self.name, ex))
+                commands_failed.inc(command.service_uri)
+                # state changes already collected stay pending and are flushed with the following ones
+                self.__respond(command, cc_lib.client.message.Message(json.dumps({"status": 1})))
+                continue
+            except TypeError as ex:
+                logger.error("{}: could not parse command response data - {}".format(self.name, ex))
+                commands_failed.inc(command.service_uri)
+                self.__respond(command, cc_lib.client.message.Message(json.dumps({"status": 1})))
+                continue
+            self.__respond(command, cmd_resp)
+            return items[index + 1:], None
+        self.__flush(device, pending)
+        return list(), None
 
-    def stop(self):
-        self.__stop = True
+    def __flush(self, device, pending: list):
+        # state changes that were queued back to back end up in a single request,
+        # superseded commands are answered with the outcome of that request
+        if not pending:
+            return
+        if len(pending) > 1:
+            logger.debug("{}: coalesced {} commands for '{}'".format(self.name, len(pending), device.id))
+        if metrics.enabled:
+            now = time.time()
+            for command, _, _ in pending:
+                command_wait.observe(now - command.timestamp, command.service_uri)
+        token = tracer.bind(command for command, _, _ in pending)
+        deadline = bindDeadline(command for command, _, _ in pending)
+        service_token = bindService(command for command, _, _ in pending)
+        try:
+            err, body = putState(device, mergeStates(body for _, _, body in pending))
+        finally:
+            unbindService(service_token)
+            unbindDeadline(deadline)
+            tracer.unbind(token)
+        if err:
+            logger.error("'{}' for '{}' failed - {}".format(pending[-1][1].__name__, device.id, body))
+        data = json.dumps({"status": int(err)})
+        for command, _, _ in pending:
+            self.__respond(command, cc_lib.client.message.Message(data))
 
-    def execute(self, command):
-        self.__command_queue.put_nowait(command)
+    def __respond(self, command, cmd_resp):
+        self.__handled.add(id(command))
+        command.message = cmd_resp
+        logger.debug("{}: '{}'".format(self.name, command))
+        if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
+            tracer.mark(command, "responding")
+            self.__client.sendResponse(command, asynchronous=True)
+        tracer.finish(command)
 
 
 class Controller(Thread):
@@ -87,35 +187,89 @@ class Controller(Thread):
         super().__init__(name="controller-{}".format(bridge_id), daemon=True)
         self.__device_manager = device_manager
         self.__client = client
-        self.__worker_pool = dict()
+        self.__scheduler = DeadlineScheduler()
+        self.__worker_pool = tuple(
+            Worker(number, client, bridge_id, self.__scheduler) for number in range(getWorkerCount())
+        )
+        self.__group_dispatcher = GroupDispatcher(
+            getTransport(bridge_id),
+            client,
+            bridge_id,
+            config.Controller.fan_out_groups
+        )
 
     def run(self):
-        logger.info("starting '{}' ...".format(self.name))
-        garbage_collector_time = time.time()
+        logger.info("starting '{}' with {} workers ...".format(self.name, len(self.__worker_pool)))
+        if metrics.enabled:
+            registerQueueDepths(self.name, lambda: self.queue_depths)
+        for worker in self.__worker_pool:
+            worker.start()
+        self.__group_dispatcher.start()
+        batch = list()
+        batch_end = 0
         while True:
             try:
-                command = self.__client.receiveCommand(timeout=30)
-                try:
-                    device = self.__device_manager.get(command.device_id)
-                    if not device.id in self.__worker_pool:
-                        worker = Worker(device, self.__client)
-                        worker.start()
-                        self.__worker_pool[device.id] = worker
-                    else:
-                        worker = self.__worker_pool[device.id]
-                    worker.execute(command)
-                    time.sleep(config.Bridge.delay)
-                except KeyError:
-                    logger.error("received command for unknown device '{}'".format(command.device_id))
+                command = self.__client.receiveCommand(timeout=max(batch_end - time.time(), 0.001) if batch else 30)
+                tracer.begin(command)
+                if config.Controller.fan_out_window > 0:
+                    if not batch:
+                        batch_end = time.time() + config.Controller.fan_out_window
+                    batch.append(command)
+                else:
+                    self.__dispatch(command)
             except cc_lib.client.CommandQueueEmptyError:
-                if time.time() - garbage_collector_time > 120:
-                    self.__collectGarbage()
-                    garbage_collector_time = time.time()
-
-    def __collectGarbage(self):
-        garbage_workers = set(self.__worker_pool) - set(self.__device_manager.devices)
-        for worker_id in garbage_workers:
-            worker = self.__worker_pool[worker_id]
-            logger.debug("stopping '{}'".format(worker.name))
-            worker.stop()
-            del self.__worker_pool[worker_id]
+                pass
+            if batch and time.time() >= batch_end:
+                self.__fanOut(batch)
+                batch = list()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__scheduler.queue_depth
+
+    @property
+    def queue_depths(self) -> dict:
+        return self.__scheduler.queue_depths
+
+    def __dispatch(self, command, item=None):
+        try:
+            self.__scheduler.put(self.__device_manager.get(command.device_id), item or command)
+            tracer.mark(command, "queued")
+        except KeyError:
+            logger.error("received command for unknown device '{}'".format(command.device_id))
+            commands_dropped.inc("unknown_device")
+            tracer.finish(command, "unknown_device")
+            if isinstance(item, GroupAction):
+                item.arrive()
+
+    def __fanOut(self, batch: list):
+        # identical state changes for enough distinct devices become one group request,
+        # devices with more than one command in the batch keep going through their worker
+        device_count = Counter(command.device_id for command in batch)
+        devices = self.__device_manager.devices
+        candidates = dict()
+        for command in batch:
+            if device_count[command.device_id] > 1:
+                continue
+            try:
+                device = devices[command.device_id]
+                service = device.getServiceType(command.service_uri)
+                if not hasattr(service, "body"):
+                    continue
+                body = service.body(device, **(json.loads(command.message.data) if command.message.data else dict()))
+                candidates.setdefault(json.dumps(body, sort_keys=True), (body, list()))[1].append(
+                    (command, device, service)
+                )
+            except (KeyError, json.JSONDecodeError, TypeError):
+                continue
+        actions = dict()
+        for body, members in candidates.values():
+            if len(members) >= config.Controller.fan_out_min:
+                action = GroupAction(members, body)
+                for command, _, _ in members:
+                    actions[id(command)] = action
+                    tracer.mark(command, "fan_out")
+        for command in batch:
+            self.__dispatch(command, actions.get(id(command)))
+        for action in set(actions.values()):
+            self.__group_dispatcher.execute(action)
@@ -19,61 +19,146 @@ if __name__ == '__main__':
     exit('Please use "client.py"')
 
 
-from typing import Dict
+from typing import Mapping, Tuple
 from threading import Lock
+from types import MappingProxyType
 import cc_lib
 
 
 logger = cc_lib.logger.getLogger(__name__)
 
+empty_mapping = MappingProxyType(dict())
+
+
+class PoolSnapshot:
+    # immutable view of the pool, replaced as a whole on every change so readers never lock
+    __slots__ = ("version", "devices", "by_number", "by_type", "by_bridge")
+
+    def __init__(self, version: int, devices: dict, by_number: dict, by_type: dict, by_bridge: dict):
+        self.version = version
+        self.devices = MappingProxyType(devices)
+        self.by_number = MappingProxyType(by_number)
+        self.by_type = MappingProxyType(by_type)
+        self.by_bridge = MappingProxyType(by_bridge)
+
+
+def buildSnapshot(version: int, devices: dict) -> PoolSnapshot:
+    by_number = dict()
+    by_type = dict()
+    by_bridge = dict()
+    for device in devices.values():
+        by_number[(device.bridge_id, device.number)] = device
+        by_type[device.device_type_id] = by_type.get(device.device_type_id, ()) + (device,)
+        by_bridge.setdefault(device.bridge_id, dict())[device.id] = device
+    return PoolSnapshot(
+        version,
+        devices,
+        by_number,
+        by_type,
+        {bridge_id: MappingProxyType(bridge_devices) for bridge_id, bridge_devices in by_bridge.items()}
+    )
+
 
 class DeviceManager:
 
     def __init__(self):
-        self.__device_pool = dict()
         self.__lock = Lock()
+        self.__snapshot = buildSnapshot(0, dict())
 
     def add(self, device: cc_lib.types.Device) -> None:
         if not isinstance(device, cc_lib.types.Device):
             raise TypeError
-        self.__lock.acquire()
-        if device.id not in self.__device_pool:
-            self.__device_pool[device.id] = device
-        else:
-            logger.warning("device '{}' already in pool".format(device.id))
-        self.__lock.release()
+        with self.__lock:
+            snapshot = self.__snapshot
+            if device.id in snapshot.devices:
+                logger.warning("device '{}' already in pool".format(device.id))
+                return
+            # writers copy and patch the current indexes, the assignment publishes them atomically
+            devices = dict(snapshot.devices)
+            devices[device.id] = device
+            by_number = dict(snapshot.by_number)
+            by_number[(device.bridge_id, device.number)] = device
+            by_type = dict(snapshot.by_type)
+            by_type[device.device_type_id] = by_type.get(device.device_type_id, ()) + (device,)
+            by_bridge = dict(snapshot.by_bridge)
+            bridge_devices = dict(by_bridge.get(device.bridge_id, empty_mapping))
+            bridge_devices[device.id] = device
+            by_bridge[device.bridge_id] = MappingProxyType(bridge_devices)
+            self.__snapshot = PoolSnapshot(snapshot.version + 1, devices, by_number, by_type, by_bridge)
+
+    def addMany(self, devices) -> None:
+        # rebuilds the snapshot once, adding devices one by one would copy the indexes for each of them
+        devices = list(devices)
+        if not all(isinstance(device, cc_lib.types.Device) for device in devices):
+            raise TypeError
+        if not devices:
+            return
+        with self.__lock:
+            pool = dict(self.__snapshot.devices)
+            for device in devices:
+                if device.id not in pool:
+                    pool[device.id] = device
+                else:
+                    logger.warning("device '{}' already in pool".format(device.id))
+            self.__snapshot = buildSnapshot(self.__snapshot.version + 1, pool)
 
     def delete(self, device_id: str) -> None:
         if not isinstance(device_id, str):
             raise TypeError
-        self.__lock.acquire()
-        try:
-            del self.__device_pool[device_id]
-        except KeyError:
-            logger.warning("device '{}' does not exist in device pool".format(device_id))
-        self.__lock.release()
+        with self.__lock:
+            snapshot = self.__snapshot
+            device = snapshot.devices.get(device_id)
+            if device is None:
+                logger.warning("device '{}' does not exist in device pool".format(device_id))
+                return
+            devices = dict(snapshot.devices)
+            del devices[device_id]
+            by_number = dict(snapshot.by_number)
+            if by_number.get((device.bridge_id, device.number)) is device:
+                del by_number[(device.bridge_id, device.number)]
+            by_type = dict(snapshot.by_type)
+            by_type[device.device_type_id] = tuple(item for item in by_type[device.device_type_id] if item is not device)
+            by_bridge = dict(snapshot.by_bridge)
+            bridge_devices = dict(by_bridge[device.bridge_id])
+            del bridge_devices[device_id]
+            by_bridge[device.bridge_id] = MappingProxyType(bridge_devices)
+            self.__snapshot = PoolSnapshot(snapshot.version + 1, devices, by_number, by_type, by_bridge)
+
+    def reindex(self) -> None:
+        # must be called after the number of a pooled device changed
+        with self.__lock:
+            self.__snapshot = buildSnapshot(self.__snapshot.version + 1, dict(self.__snapshot.devices))
 
     def get(self, device_id: str) -> cc_lib.types.Device:
         if not isinstance(device_id, str):
             raise TypeError
-        self.__lock.acquire()
         try:
-            device = self.__device_pool[device_id]
+            return self.__snapshot.devices[device_id]
         except KeyError:
             logger.error("device '{}' not in pool".format(device_id))
-            self.__lock.release()
             raise
-        self.__lock.release()
-        return device
+
+    def getByNumber(self, bridge_id: str, number: str) -> cc_lib.types.Device:
+        return self.__snapshot.by_number[(bridge_id, number)]
+
+    def getByType(self, device_type_id: str) -> Tuple[cc_lib.types.Device, ...]:
+        return self.__snapshot.by_type.get(device_type_id, ())
+
+    def getByBridge(self, bridge_id: str) -> Mapping[str, cc_lib.types.Device]:
+        return self.__snapshot.by_bridge.get(bridge_id, empty_mapping)
 
     def clear(self) -> None:
-        self.__lock.acquire()
-        self.__device_pool.clear()
-        self.__lock.release()
+        with self.__lock:
+            self.__snapshot = buildSnapshot(self.__snapshot.version + 1, dict())
+
+    @property
+    def snapshot(self) -> PoolSnapshot:
+        return self.__snapshot
+
+    @property
+    def version(self) -> int:
+        return self.__snapshot.version
 
     @property
-    def devices(self) -> Dict[str, cc_lib.types.Device]:
-        self.__lock.acquire()
-        devices = self.__device_pool.copy()
-        self.__lock.release()
-        return devices
+    def devices(self) -> Mapping[str, cc_lib.types.Device]:
+        return self.__snapshot.devices
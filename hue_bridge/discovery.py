@@ -21,14 +21,22 @@ if __name__ == '__main__':
 
 from .logger import root_logger
 from .configuration import config
-from subprocess import call, check_output, DEVNULL
+from .transport import createSSLContext, getTransport
+from .bridges import getBridge
+from .host_cache import host_cache
+from .mdns import queryMDNS, MDNSListener
+from .metrics import discovery_duration
+from subprocess import check_output
 from socket import gethostbyname, getfqdn
-from threading import Thread
+from threading import Thread, Event
+from queue import Queue
+from functools import partial
 from platform import system
 from urllib.parse import urlparse
 from urllib3 import disable_warnings as urllib3DisableWarnings
 from urllib3.exceptions import InsecureRequestWarning as urllib3InsecureRequestWarning
-import time, io, socket, requests
+from ipaddress import ip_address, ip_network
+import time, io, socket, asyncio, requests, aiohttp
 import http.client as HTTPclient
 from os import getenv
 
@@ -36,9 +44,6 @@ logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 urllib3DisableWarnings(urllib3InsecureRequestWarning)
 
-def ping(host) -> bool:
-    return call(['ping', '-c', '2', '-t', '2', host], stdout=DEVNULL, stderr=DEVNULL) == 0
-
 
 def getLocalIP() -> str:
     try:
@@ -50,10 +55,8 @@ def getLocalIP() -> str:
         else:
             sys_type = system().lower()
             if 'linux' in sys_type:
-                local_ip = check_output(['hostname', '-I']).decode()
-                local_ip = local_ip.replace(' ', '')
-                local_ip = local_ip.replace('\n', '')
-                return local_ip
+                # 'hostname -I' lists all addresses, the first one belongs to the primary interface
+                return check_output(['hostname', '-I']).decode().split()[0]
             elif 'darwin' in sys_type:
                 local_ip = gethostbyname(getfqdn())
                 if type(local_ip) is str and local_ip.count('.') == 3:
@@ -65,51 +68,118 @@ def getLocalIP() -> str:
         exit()
 
 
-def getIpRange(local_ip) -> list:
-    split_ip = local_ip.rsplit('.', 1)
-    base_ip = split_ip[0] + '.'
-    if len(split_ip) > 1:
-        ip_range = [str(base_ip) + str(i) for i in range(2,255)]
-        ip_range.remove(local_ip)
-        return ip_range
-    return list()
-
-
-def discoverHostsWorker(ip_range, alive_hosts):
-    for ip in ip_range:
-        if ping(ip):
-            alive_hosts.append(ip)
-
-
-def discoverHosts() -> list:
-    ip_range = getIpRange(getLocalIP())
-    alive_hosts = list()
-    workers = list()
-    bin = 0
-    bin_size = 3
-    if ip_range:
-        for i in range(int(len(ip_range) / bin_size)):
-            worker = Thread(target=discoverHostsWorker, name='discoverHostsWorker', args=(ip_range[bin:bin+bin_size], alive_hosts))
-            workers.append(worker)
-            worker.start()
-            bin = bin + bin_size
-        if ip_range[bin:]:
-            worker = Thread(target=discoverHostsWorker, name='discoverHostsWorker', args=(ip_range[bin:], alive_hosts))
-            workers.append(worker)
-            worker.start()
-        for worker in workers:
-            worker.join()
-    return alive_hosts
-
-
-def discoverNUPnP() -> str:
+def getSubnet(local_ip):
+    if config.Discovery.subnet:
+        return ip_network(config.Discovery.subnet, strict=False)
+    return ip_network("{}/24".format(local_ip), strict=False)
+
+
+def getNeighbors() -> dict:
+    # kernel neighbor table, maps ip to mac for hosts that were recently seen on the link
+    neighbors = dict()
+    try:
+        with open("/proc/net/arp") as file:
+            next(file, None)
+            for line in file:
+                fields = line.split()
+                if len(fields) >= 4 and fields[3] != "00:00:00:00:00:00":
+                    neighbors[fields[0]] = fields[3].lower()
+    except OSError:
+        pass
+    return neighbors
+
+
+def getScanHosts(local_ip):
+    # hosts from the neighbor table first, they answer far more likely than the rest of the range
+    subnet = getSubnet(local_ip)
+    local_ip = ip_address(local_ip)
+    neighbors = [host for host in getNeighbors() if ip_address(host) in subnet and ip_address(host) != local_ip]
+    for host in neighbors:
+        yield host
+    neighbors = set(neighbors)
+    for host in subnet.hosts():
+        if host != local_ip and str(host) not in neighbors:
+            yield str(host)
+
+
+async def probePort(host, port) -> bool:
     try:
-        response = requests.get(config.Discovery.nupnp)
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), config.Discovery.probe_timeout)
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+
+def isBridge(host_info, bridge_id: str) -> bool:
+    # any https host may answer with json, only a non-empty id of the wanted bridge counts
+    found_id = host_info.get('bridgeid') if isinstance(host_info, dict) else None
+    return isinstance(found_id, str) and bool(found_id) and found_id in bridge_id
+
+
+async def validateHostAsync(session: aiohttp.ClientSession, host, bridge_id: str) -> bool:
+    try:
+        async with session.get("https://{}/{}/na/config".format(host, config.Bridge.api_path)) as response:
+            if response.status == 200:
+                if isBridge(await response.json(content_type=None), bridge_id):
+                    return True
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError):
+        pass
+    return False
+
+
+async def scanWorker(hosts, session: aiohttp.ClientSession, bridge_id: str, result: asyncio.Future, stop: Event):
+    for host in hosts:
+        if result.done() or stop.is_set():
+            return
+        try:
+            if any(await asyncio.gather(probePort(host, 443), probePort(host, 80))):
+                if await validateHostAsync(session, host, bridge_id) and not result.done():
+                    result.set_result(host)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            # a single misbehaving host must not end the scan
+            logger.debug("could not probe '{}' - {}".format(host, ex))
+
+
+async def scanHosts(hosts, bridge_id: str, stop: Event):
+    result = asyncio.get_running_loop().create_future()
+    timeout = aiohttp.ClientTimeout(total=config.Bridge.connect_timeout + config.Bridge.read_timeout)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=createSSLContext()), timeout=timeout) as session:
+        # all workers share one host generator, so the number of open probes stays bounded
+        workers = [
+            asyncio.ensure_future(scanWorker(hosts, session, bridge_id, result, stop))
+            for _ in range(config.Discovery.scan_concurrency)
+        ]
+        try:
+            await asyncio.wait(
+                (result, asyncio.gather(*workers, return_exceptions=True)),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    return result.result() if result.done() else None
+
+
+def discoverHosts(bridge_id: str, stop: Event = None) -> str:
+    local_ip = getLocalIP()
+    start = time.time()
+    host = asyncio.run(scanHosts(getScanHosts(local_ip), bridge_id, stop or Event()))
+    logger.debug("ip range scan took {:.1f}s".format(time.time() - start))
+    return host
+
+
+def discoverNUPnP(bridge_id: str) -> str:
+    try:
+        response = requests.get(config.Discovery.nupnp, timeout=(config.Bridge.connect_timeout, config.Bridge.read_timeout))
         if response.status_code == 200:
             host_list = response.json()
             for host in host_list:
                 try:
-                    if host.get('id').upper() in config.Bridge.id:
+                    if host.get('id').upper() in bridge_id:
                         return host.get('internalipaddress')
                 except AttributeError:
                     logger.error("could not extract host ip from '{}'".format(host))
@@ -122,7 +192,7 @@ class DummySocket(io.BytesIO):
         return self
 
 
-def discoverSSDP() -> str:
+def discoverSSDP(bridge_id: str, stop: Event = None) -> str:
     broadcast_msg = \
         'M-SEARCH * HTTP/1.1\r\n' \
         'HOST: 239.255.255.250:1900\r\n' \
@@ -132,99 +202,133 @@ def discoverSSDP() -> str:
         '\r\n'
     try:
         udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        udp_socket.settimeout(20)
+        # short socket timeouts so a cancelled search stops within a second
+        udp_socket.settimeout(1)
         udp_socket.sendto(broadcast_msg.encode(), ('239.255.255.250', 1900))
-        try:
-            while True:
+        end = time.time() + 20
+        while time.time() < end and not (stop and stop.is_set()):
+            try:
                 response = udp_socket.recv(65507)
                 response = HTTPclient.HTTPResponse(DummySocket(response))
                 response.begin()
-                if response.getheader('hue-bridgeid') and response.getheader('hue-bridgeid') in config.Bridge.id and response.getheader('LOCATION'):
+                if response.getheader('hue-bridgeid') and response.getheader('hue-bridgeid') in bridge_id and response.getheader('LOCATION'):
                     udp_socket.close()
                     return urlparse(response.getheader('LOCATION')).hostname
-        except socket.timeout:
-            pass
+            except socket.timeout:
+                pass
+        udp_socket.close()
     except Exception as ex:
         logger.warning("SSDP discovery failed - {}".format(ex))
 
 
-def probeHost(host) -> bool:
-    try:
-        response = requests.head("http://{}/{}/na/config".format(host, config.Bridge.api_path))
-        if response.status_code == 200:
-                return True
-    except Exception:
-        pass
-    return False
+def discoverMDNS(bridge_id: str, stop: Event = None) -> str:
+    if config.Discovery.mdns:
+        return queryMDNS(bridge_id, config.Discovery.mdns_timeout, stop)
 
 
-def validateHost(host) -> bool:
+def validateHost(host, bridge_id: str) -> bool:
     try:
-        response = requests.get("https://{}/{}/na/config".format(host, config.Bridge.api_path), verify=False)
+        response = requests.get(
+            "https://{}/{}/na/config".format(host, config.Bridge.api_path),
+            verify=False,
+            timeout=(config.Bridge.connect_timeout, config.Bridge.read_timeout)
+        )
         if response.status_code == 200:
-            host_info = response.json()
-            if host_info.get('bridgeid') in config.Bridge.id:
+            if isBridge(response.json(), bridge_id):
                 return True
     except Exception:
         pass
     return False
 
 
-def validateHostsWorker(hosts, valid_hosts):
-    for host in hosts:
-        if probeHost(host) and validateHost(host):
-            valid_hosts[config.Bridge.id] = host
-
-
-def validateHosts(hosts) -> dict:
-    valid_hosts = dict()
-    workers = list()
-    bin = 0
-    bin_size = 2
-    if len(hosts) <= bin_size:
-        worker = Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts, valid_hosts))
-        workers.append(worker)
-        worker.start()
-    else:
-        for i in range(int(len(hosts) / bin_size)):
-            worker = Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:bin + bin_size], valid_hosts))
-            workers.append(worker)
-            worker.start()
-            bin = bin + bin_size
-        if hosts[bin:]:
-            worker = Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:], valid_hosts))
-            workers.append(worker)
-            worker.start()
-    for worker in workers:
-        worker.join()
-    return valid_hosts
-
-
-def discoverBridge():
-    host = None
-    if config.Bridge.host:
-        if validateHost(config.Bridge.host):
-            host = config.Bridge.host
+def raceStrategies(strategies) -> tuple:
+    # runs all strategies at once, the first validated host wins and the others are asked to stop
+    stop = Event()
+    results = Queue()
+
+    def runner(name, strategy):
+        host = None
+        try:
+            host = strategy(stop)
+        except Exception as ex:
+            logger.warning("{} discovery failed - {}".format(name, ex))
+        finally:
+            results.put((name, host))
+
+    for name, strategy in strategies:
+        Thread(target=runner, name="discovery-{}".format(name), args=(name, strategy), daemon=True).start()
+    try:
+        for _ in strategies:
+            name, host = results.get()
+            if host:
+                return name, host
+            logger.debug("{} discovery yielded no results".format(name))
+    finally:
+        stop.set()
+    return None, None
+
+
+def validated(strategy, bridge_id: str):
+    def validatedStrategy(stop: Event):
+        host = strategy(stop)
+        if host and validateHost(host, bridge_id):
+            return host
+    return validatedStrategy
+
+
+def getCachedHosts(bridge_id: str) -> list:
+    hosts = list()
+    if getBridge(bridge_id).host:
+        hosts.append(getBridge(bridge_id).host)
+    hosts += host_cache.getHosts(bridge_id)
+    mac = host_cache.getMac(bridge_id)
+    if mac:
+        hosts += [host for host, neighbor_mac in getNeighbors().items() if neighbor_mac == mac]
+    return list(dict.fromkeys(hosts))
+
+
+def discoverBridge(bridge_id: str = None):
+    bridge = getBridge(bridge_id or config.Bridge.id)
+    start = time.time()
+    strategy, host = raceStrategies(
+        [("cache", validated(lambda stop, host=host: host, bridge.id)) for host in getCachedHosts(bridge.id)]
+    )
     while not host:
-        host = discoverNUPnP()
-        if host and not validateHost(host):
-            host = None
+        strategy, host = raceStrategies(
+            (
+                ("mDNS", validated(partial(discoverMDNS, bridge.id), bridge.id)),
+                ("NUPnP", validated(lambda stop: discoverNUPnP(bridge.id), bridge.id)),
+                ("SSDP", validated(partial(discoverSSDP, bridge.id), bridge.id)),
+                ("ip range scan", partial(discoverHosts, bridge.id))
+            )
+        )
         if not host:
-            logger.warning("could not retrieve host from cloud - reverting to SSDP")
-            host = discoverSSDP()
-            if not host:
-                logger.warning("could not discover host via SSDP - reverting to ip range scan")
-                valid_hosts = validateHosts(discoverHosts())
-                if valid_hosts:
-                    host = valid_hosts[config.Bridge.id]
-                    continue
-                else:
-                    logger.warning("ip range scan yielded no results")
-            else:
-                continue
-        else:
-            continue
-        time.sleep(10)
-    if config.Bridge.host != host:
-        config.Bridge.host = host
-    logger.info("discovered hue bridge '{}' at '{}'".format(config.Bridge.id, config.Bridge.host))
+            logger.warning("could not discover hue bridge '{}' - retrying in 10s".format(bridge.id))
+            time.sleep(10)
+    if bridge.host != host:
+        bridge.host = host
+    getTransport(bridge.id).host = host
+    host_cache.add(bridge.id, host, getNeighbors().get(host))
+    discovery_duration.set(round(time.time() - start, 3), bridge.id, strategy)
+    logger.info("discovered hue bridge '{}' at '{}' via {} in {:.1f}s".format(
+        bridge.id,
+        bridge.host,
+        strategy,
+        time.time() - start
+    ))
+
+
+def updateBridgeHost(bridge_id: str, host: str):
+    bridge = getBridge(bridge_id)
+    if host != bridge.host and validateHost(host, bridge.id):
+        logger.info("hue bridge '{}' announced new address '{}'".format(bridge.id, host))
+        bridge.host = host
+        getTransport(bridge.id).host = host
+        host_cache.add(bridge.id, host, getNeighbors().get(host))
+
+
+def startMDNSListener(bridge_id: str = None):
+    # keeps the bridge address current when it changes while the connector is running
+    if config.Discovery.mdns:
+        bridge_id = bridge_id or config.Bridge.id
+        MDNSListener(bridge_id, partial(updateBridgeHost, bridge_id)).start()
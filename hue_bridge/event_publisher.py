@@ -0,0 +1,119 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from threading import Thread, Condition
+from collections import OrderedDict
+import time, json, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+tracked_fields = ("on", "bri", "xy", "ct", "reachable")
+
+reachable_index = tracked_fields.index("reachable")
+
+status_service = "getStatus"
+
+
+def getTrackedFields(state: dict) -> tuple:
+    return tuple(tuple(state[key]) if isinstance(state.get(key), list) else state.get(key) for key in tracked_fields)
+
+
+class EventPublisher(Thread):
+    def __init__(self, client: cc_lib.client.Client, bridge_id: str):
+        super().__init__(name="event-publisher-{}".format(bridge_id), daemon=True)
+        self.__client = client
+        self.__condition = Condition()
+        self.__pending = OrderedDict()
+        self.__published = dict()
+
+    def run(self) -> None:
+        logger.debug("'{}': starting ...".format(self.name))
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+                now = time.monotonic()
+                due = list()
+                next_due = None
+                for device_id, device in list(self.__pending.items()):
+                    published = self.__published.get(device_id)
+                    if published and now - published[1] < config.Events.min_interval:
+                        # rate limited, the latest state goes out once the interval has passed
+                        release_time = published[1] + config.Events.min_interval
+                        next_due = release_time if next_due is None else min(next_due, release_time)
+                        continue
+                    due.append(device)
+                    del self.__pending[device_id]
+                if not due:
+                    self.__condition.wait(next_due - now)
+                    continue
+            self.__emit(due)
+
+    def __emit(self, devices: list):
+        count = 0
+        for device in devices:
+            state = device.state
+            fields = getTrackedFields(state)
+            published = self.__published.get(device.id)
+            if published and published[0] == fields:
+                continue
+            # an unreachable light is only published when it was reachable before
+            if not fields[reachable_index] and not (published and published[0][reachable_index]):
+                continue
+            try:
+                data = device.getServiceType(status_service).payload(device, False, state)
+                if not fields[reachable_index]:
+                    # the status payload has no reachability field, unreachable lights report a failed status
+                    data["status"] = 1
+                self.__client.emmitEvent(
+                    cc_lib.client.message.EventEnvelope(
+                        device,
+                        status_service,
+                        cc_lib.client.message.Message(json.dumps(data))
+                    ),
+                    asynchronous=True
+                )
+                count += 1
+            except (KeyError, TypeError) as ex:
+                logger.error("could not create event for '{}' - {}".format(device.id, ex))
+            except cc_lib.client.NotConnectedError:
+                logger.warning("could not publish event for '{}' - not connected".format(device.id))
+                continue
+            self.__published[device.id] = (fields, time.monotonic())
+        if count:
+            logger.debug("{}: published {} events".format(self.name, count))
+
+    def publish(self, devices):
+        if not config.Events.enabled:
+            return
+        with self.__condition:
+            for device in devices:
+                self.__pending[device.id] = device
+            if self.__pending:
+                self.__condition.notify()
+
+    def forget(self, device_id: str):
+        with self.__condition:
+            self.__pending.pop(device_id, None)
+            self.__published.pop(device_id, None)
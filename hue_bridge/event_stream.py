@@ -0,0 +1,71 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from typing import Iterable, Iterator, Tuple, Optional
+
+
+def parseEventStream(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], str]]:
+    # minimal server-sent events parser, yields (last event id, data) per dispatched event
+    event_id = None
+    data = list()
+    for line in lines:
+        if line is None:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line:
+            if data:
+                yield event_id, "\n".join(data)
+                data = list()
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            data.append(value)
+        elif field == "id":
+            event_id = value
+    if data:
+        yield event_id, "\n".join(data)
+
+
+def getLightNumber(resource: dict) -> Optional[str]:
+    id_v1 = resource.get("id_v1") or str()
+    if id_v1.startswith("/lights/"):
+        return id_v1.rsplit("/", 1)[-1]
+
+
+def convertResource(resource: dict) -> dict:
+    # translate a CLIP v2 resource update into the v1 state fields kept on devices
+    state = dict()
+    if "on" in resource:
+        state["on"] = resource["on"].get("on")
+    if "dimming" in resource and "brightness" in resource["dimming"]:
+        state["bri"] = min(max(round(resource["dimming"]["brightness"] * 254 / 100), 1), 254)
+    if "color" in resource and "xy" in resource["color"]:
+        state["xy"] = [resource["color"]["xy"]["x"], resource["color"]["xy"]["y"]]
+    if "color_temperature" in resource and resource["color_temperature"].get("mirek") is not None:
+        state["ct"] = resource["color_temperature"]["mirek"]
+    if resource.get("type") == "zigbee_connectivity" and "status" in resource:
+        state["reachable"] = resource["status"] == "connected"
+    return state
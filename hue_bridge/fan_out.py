@@ -0,0 +1,216 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .logger import root_logger
+from .transport import Transport
+from .types.service import putState, updateState, hueBridgeGroupPut
+from .tracing import tracer
+from .metrics import bindService, unbindService
+from .resilience import bindDeadline, unbindDeadline
+from threading import Thread, Lock, Event
+from queue import Queue
+from collections import OrderedDict
+from requests import exceptions
+import json, hashlib, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+group_name_prefix = "cc-fan-out-"
+
+
+class GroupPool:
+    def __init__(self, transport: Transport, size: int):
+        self.__transport = transport
+        self.__size = max(size, 1)
+        self.__groups = OrderedDict()
+        self.__loaded = False
+
+    def __load(self):
+        # reuse groups left behind by a previous run instead of piling up new ones
+        resp = self.__transport.getGroups()
+        if resp.status_code == 200:
+            for number, group in resp.json().items():
+                if str(group.get("name", "")).startswith(group_name_prefix):
+                    self.__groups[frozenset(group.get("lights", list()))] = number
+        self.__loaded = True
+
+    def __evict(self) -> bool:
+        if not self.__groups:
+            return False
+        lights, number = self.__groups.popitem(last=False)
+        try:
+            self.__transport.deleteGroup(number)
+            logger.debug("deleted group '{}'".format(number))
+        except exceptions.RequestException as ex:
+            logger.warning("could not delete group '{}' - {}".format(number, ex))
+        return True
+
+    def __create(self, lights: frozenset):
+        name = "{}{}".format(group_name_prefix, hashlib.sha1(",".join(sorted(lights)).encode()).hexdigest()[:12])
+        resp = self.__transport.createGroup(name, sorted(lights))
+        if resp.status_code == 200:
+            resp = resp.json()
+            if isinstance(resp, list):
+                if "success" in resp[0]:
+                    return False, resp[0]["success"]["id"]
+                if "error" in resp[0]:
+                    return resp[0]["error"]["type"], resp[0]["error"]["description"]
+            return True, "unknown error"
+        return True, resp.status_code
+
+    def get(self, lights) -> str:
+        lights = frozenset(lights)
+        try:
+            if not self.__loaded:
+                self.__load()
+            if lights in self.__groups:
+                self.__groups.move_to_end(lights)
+                return self.__groups[lights]
+            while len(self.__groups) >= self.__size:
+                self.__evict()
+            err, body = self.__create(lights)
+            # 301: the bridge group table is full, make room and try once more
+            if err == 301 and self.__evict():
+                err, body = self.__create(lights)
+            if err:
+                logger.error("could not create group for {} - {}".format(sorted(lights), body))
+                return None
+            self.__groups[lights] = body
+            logger.debug("created group '{}' for {}".format(body, sorted(lights)))
+            return body
+        except exceptions.RequestException as ex:
+            logger.error("could not acquire group - {}".format(ex))
+
+
+class GroupAction:
+    def __init__(self, members: list, body: dict):
+        self.members = members
+        self.body = body
+        self.ready = Event()
+        self.done = Event()
+        self.__pending = len(members)
+        self.__callbacks = list()
+        self.__lock = Lock()
+
+    def arrive(self):
+        # called by each member's worker once all prior commands of its device are done
+        with self.__lock:
+            self.__pending -= 1
+            if self.__pending <= 0:
+                self.ready.set()
+
+    def addDoneCallback(self, callback):
+        with self.__lock:
+            if not self.done.is_set():
+                self.__callbacks.append(callback)
+                return
+        callback()
+
+    def finish(self):
+        with self.__lock:
+            self.done.set()
+            callbacks = self.__callbacks
+            self.__callbacks = list()
+        for callback in callbacks:
+            callback()
+
+
+class GroupDispatcher(Thread):
+    def __init__(self, transport: Transport, client: cc_lib.client.Client, bridge_id: str, pool_size: int):
+        super().__init__(name="group-dispatcher-{}".format(bridge_id), daemon=True)
+        self.__client = client
+        self.__bridge_id = bridge_id
+        self.__group_pool = GroupPool(transport, pool_size)
+        self.__action_queue = Queue()
+
+    def run(self) -> None:
+        logger.debug("'{}': starting ...".format(self.name))
+        while True:
+            action: GroupAction = self.__action_queue.get()
+            if not action.ready.wait(30):
+                logger.warning("{}: not all member workers ready - sending anyway".format(self.name))
+            answered = set()
+            try:
+                self.__execute(action, answered)
+            except Exception as ex:
+                # the member workers wait for this action, so it fails instead of ending the dispatcher
+                logger.error("{}: group action failed - {}".format(self.name, ex))
+                for command, _, _ in action.members:
+                    if id(command) not in answered:
+                        try:
+                            self.__respond(command, True, answered)
+                        except Exception as ex:
+                            logger.error("{}: could not answer '{}' - {}".format(self.name, command, ex))
+            finally:
+                action.finish()
+
+    def __execute(self, action: GroupAction, answered: set):
+        service_name = action.members[-1][2].__name__
+        group = self.__group_pool.get(device.number for _, device, _ in action.members)
+        if group:
+            logger.debug("{}: '{}' for {} devices via group '{}'".format(
+                self.name, service_name, len(action.members), group)
+            )
+            token = tracer.bind(command for command, _, _ in action.members)
+            deadline = bindDeadline(command for command, _, _ in action.members)
+            service_token = bindService(command for command, _, _ in action.members)
+            try:
+                err, body = hueBridgeGroupPut(self.__bridge_id, group, action.body)
+            finally:
+                unbindService(service_token)
+                unbindDeadline(deadline)
+                tracer.unbind(token)
+            if err:
+                logger.error("'{}' for group '{}' failed - {}".format(service_name, group, body))
+            else:
+                for _, device, _ in action.members:
+                    updateState(device, action.body)
+            results = [err] * len(action.members)
+        else:
+            results = list()
+            for command, device, _ in action.members:
+                token = tracer.bind((command,))
+                deadline = bindDeadline((command,))
+                service_token = bindService((command,))
+                try:
+                    err, body = putState(device, action.body)
+                finally:
+                    unbindService(service_token)
+                    unbindDeadline(deadline)
+                    tracer.unbind(token)
+                if err:
+                    logger.error("'{}' for '{}' failed - {}".format(service_name, device.id, body))
+                results.append(err)
+        for (command, _, _), err in zip(action.members, results):
+            self.__respond(command, err, answered)
+
+    def __respond(self, command, err: bool, answered: set):
+        answered.add(id(command))
+        command.message = cc_lib.client.message.Message(json.dumps({"status": int(err)}))
+        logger.debug("{}: '{}'".format(self.name, command))
+        if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
+            tracer.mark(command, "responding")
+            self.__client.sendResponse(command, asynchronous=True)
+        tracer.finish(command)
+
+    def execute(self, action: GroupAction):
+        self.__action_queue.put_nowait(action)
@@ -0,0 +1,95 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import user_dir
+from .logger import root_logger
+from threading import Lock
+from os import replace as os_replace, remove as os_remove
+from os.path import join as path_join, dirname, basename
+from tempfile import NamedTemporaryFile
+import json
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class HostCache:
+    def __init__(self, path: str, size: int = 5):
+        self.__path = path
+        self.__size = size
+        self.__lock = Lock()
+        self.__entries = self.__load()
+
+    def __load(self) -> dict:
+        try:
+            with open(self.__path) as file:
+                entries = json.load(file)
+            if isinstance(entries, dict):
+                return entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as ex:
+            logger.warning("could not load host cache - {}".format(ex))
+        return dict()
+
+    def __save(self):
+        # shard processes save concurrently, each writes its own temporary file
+        tmp_path = None
+        try:
+            with NamedTemporaryFile(
+                "w",
+                dir=dirname(self.__path) or None,
+                prefix="{}.".format(basename(self.__path)),
+                suffix=".tmp",
+                delete=False
+            ) as file:
+                tmp_path = file.name
+                json.dump(self.__entries, file, indent=2)
+            os_replace(tmp_path, self.__path)
+        except OSError as ex:
+            logger.warning("could not save host cache - {}".format(ex))
+            if tmp_path:
+                try:
+                    os_remove(tmp_path)
+                except OSError:
+                    pass
+
+    def getHosts(self, bridge_id: str) -> list:
+        with self.__lock:
+            return list(self.__entries.get(bridge_id, dict()).get("hosts", list()))
+
+    def getMac(self, bridge_id: str) -> str:
+        with self.__lock:
+            return self.__entries.get(bridge_id, dict()).get("mac")
+
+    def add(self, bridge_id: str, host: str, mac: str = None):
+        with self.__lock:
+            # shard processes share the file, reload so entries of other processes are kept
+            self.__entries = self.__load()
+            entry = self.__entries.setdefault(bridge_id, dict())
+            hosts = [host] + [item for item in entry.get("hosts", list()) if item != host]
+            entry["hosts"] = hosts[:self.__size]
+            if mac:
+                entry["mac"] = mac
+            self.__save()
+
+
+host_cache = HostCache(path_join(user_dir, "hosts.json"))
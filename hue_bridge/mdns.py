@@ -0,0 +1,164 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .logger import root_logger
+from threading import Thread, Event
+from typing import Callable
+import socket, struct, time
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+mdns_group = "224.0.0.251"
+mdns_port = 5353
+
+hue_service = "_hue._tcp.local"
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_SRV = 33
+
+
+def buildQuery(name: str, rtype: int = TYPE_PTR) -> bytes:
+    question = b"".join(struct.pack("!B", len(label)) + label.encode() for label in name.split(".")) + b"\x00"
+    return struct.pack("!6H", 0, 0, 1, 0, 0, 0) + question + struct.pack("!HH", rtype, 1)
+
+
+def readName(data: bytes, offset: int) -> tuple:
+    labels = list()
+    end = None
+    # bounded so malformed compression pointers can't loop forever
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode(errors="replace"))
+        offset += length
+    return ".".join(labels), end if end is not None else offset
+
+
+def parseMessage(data: bytes) -> list:
+    _, _, qd_count, an_count, ns_count, ar_count = struct.unpack("!6H", data[:12])
+    offset = 12
+    for _ in range(qd_count):
+        _, offset = readName(data, offset)
+        offset += 4
+    records = list()
+    for _ in range(an_count + ns_count + ar_count):
+        name, offset = readName(data, offset)
+        rtype, _, _, length = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + length]
+        if rtype == TYPE_A and length == 4:
+            records.append((name.lower(), rtype, socket.inet_ntoa(rdata)))
+        elif rtype == TYPE_PTR:
+            records.append((name.lower(), rtype, readName(data, offset)[0].lower()))
+        elif rtype == TYPE_SRV:
+            port = struct.unpack("!H", data[offset + 4:offset + 6])[0]
+            records.append((name.lower(), rtype, (readName(data, offset + 6)[0].lower(), port)))
+        elif rtype == TYPE_TXT:
+            txt = dict()
+            position = 0
+            while position < length:
+                size = rdata[position]
+                key, _, value = rdata[position + 1:position + 1 + size].decode(errors="replace").partition("=")
+                txt[key.lower()] = value
+                position += size + 1
+            records.append((name.lower(), rtype, txt))
+        offset += length
+    return records
+
+
+def getBridges(records: list) -> dict:
+    # maps the bridge ids found in TXT records to the address of their SRV target
+    txt = {name: value for name, rtype, value in records if rtype == TYPE_TXT}
+    srv = {name: value for name, rtype, value in records if rtype == TYPE_SRV}
+    addresses = {name: value for name, rtype, value in records if rtype == TYPE_A}
+    bridges = dict()
+    for instance, values in txt.items():
+        if "bridgeid" in values and instance in srv and srv[instance][0] in addresses:
+            bridges[values["bridgeid"].upper()] = addresses[srv[instance][0]]
+    return bridges
+
+
+def queryMDNS(bridge_id: str, timeout: float, stop: Event = None) -> str:
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        udp_socket.settimeout(0.5)
+        udp_socket.sendto(buildQuery(hue_service), (mdns_group, mdns_port))
+        end = time.time() + timeout
+        while time.time() < end and not (stop and stop.is_set()):
+            try:
+                data, _ = udp_socket.recvfrom(9000)
+                for found_id, host in getBridges(parseMessage(data)).items():
+                    if found_id in bridge_id:
+                        return host
+            except socket.timeout:
+                pass
+            except (struct.error, IndexError) as ex:
+                logger.debug("could not parse mDNS response - {}".format(ex))
+    finally:
+        udp_socket.close()
+
+
+class MDNSListener(Thread):
+    def __init__(self, bridge_id: str, callback: Callable[[str], None]):
+        super().__init__(name="mdns-listener-{}".format(bridge_id), daemon=True)
+        self.__bridge_id = bridge_id
+        self.__callback = callback
+        self.__host = None
+
+    def run(self) -> None:
+        try:
+            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            udp_socket.bind(("", mdns_port))
+            udp_socket.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_ADD_MEMBERSHIP,
+                struct.pack("4s4s", socket.inet_aton(mdns_group), socket.inet_aton("0.0.0.0"))
+            )
+        except OSError as ex:
+            logger.warning("could not start mDNS listener - {}".format(ex))
+            return
+        logger.debug("'{}': starting ...".format(self.name))
+        while True:
+            try:
+                data, _ = udp_socket.recvfrom(9000)
+                for found_id, host in getBridges(parseMessage(data)).items():
+                    if found_id in self.__bridge_id and host != self.__host:
+                        self.__host = host
+                        self.__callback(host)
+            except (struct.error, IndexError) as ex:
+                logger.debug("could not parse mDNS message - {}".format(ex))
+            except OSError as ex:
+                logger.error("mDNS listener failed - {}".format(ex))
+                return
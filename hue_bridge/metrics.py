@@ -0,0 +1,240 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from bisect import bisect_left
+from typing import Callable
+from contextvars import ContextVar
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+prefix = "hue_connector_"
+
+# read once, so disabled metrics cost a single attribute check on the hot path
+enabled = bool(config.Metrics.enabled)
+
+time_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+
+
+def formatLabels(names: tuple, values: tuple, extra: str = None) -> str:
+    items = ['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{{{}}}".format(",".join(items)) if items else ""
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = prefix + name
+        self.description = description
+        self.labels = labels
+        self._lock = Lock()
+        self._values = dict()
+
+    def header(self) -> list:
+        return ["# HELP {} {}".format(self.name, self.description), "# TYPE {} {}".format(self.name, self.kind)]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + ["{}{} {}".format(self.name, formatLabels(self.labels, key), value) for key, value in values]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + ["{}{} {}".format(self.name, formatLabels(self.labels, key), value) for key, value in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = time_buckets):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        if not enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self) -> list:
+        with self._lock:
+            values = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(
+                    "{}_bucket{} {}".format(self.name, formatLabels(self.labels, key, 'le="{}"'.format(bound)), cumulative)
+                )
+            lines.append("{}_sum{} {}".format(self.name, formatLabels(self.labels, key), total))
+            lines.append("{}_count{} {}".format(self.name, formatLabels(self.labels, key), count))
+        return lines
+
+
+command_wait = Histogram(
+    "command_wait_seconds",
+    "time between the command timestamp and the bridge request serving it",
+    ("service",)
+)
+bridge_round_trip = Histogram(
+    "bridge_round_trip_seconds",
+    "duration of bridge requests",
+    ("bridge", "operation", "service")
+)
+bridge_errors = Counter("bridge_errors_total", "bridge requests that failed", ("bridge", "operation"))
+commands_dropped = Counter("commands_dropped_total", "commands that were dropped before execution", ("reason",))
+commands_failed = Counter("commands_failed_total", "commands that could not be executed", ("service",))
+poll_duration = Histogram("monitor_poll_duration_seconds", "duration of a bridge query and its evaluation", ("bridge",))
+diff_size = Gauge("monitor_diff_size", "devices found by the last evaluation per kind of change", ("bridge", "kind"))
+discovery_duration = Gauge("discovery_duration_seconds", "duration of the last bridge discovery", ("bridge", "strategy"))
+bridge_retries = Counter("bridge_retries_total", "bridge requests that were repeated after a failure", ("bridge", "operation"))
+poll_interval = Gauge("monitor_poll_interval_seconds", "current poll interval of the monitor", ("monitor",))
+poll_reason = Gauge("monitor_poll_reason", "reason of the current poll interval, 1 for the active reason", ("monitor", "reason"))
+breaker_state = Gauge("bridge_breaker_state", "circuit breaker state per bridge (0 closed, 1 half-open, 2 open)", ("bridge",))
+
+# service of the commands a bridge request is made for, bound like the traces of the tracer,
+# requests of the monitor or the discovery are observed with 'none'
+current_service = ContextVar("current_service", default="none")
+
+
+def bindService(commands):
+    services = {command.service_uri for command in commands}
+    if not services:
+        return None
+    return current_service.set(services.pop() if len(services) == 1 else "mixed")
+
+
+def unbindService(token):
+    if token is not None:
+        current_service.reset(token)
+
+
+registry = [
+    command_wait,
+    bridge_round_trip,
+    bridge_errors,
+    commands_dropped,
+    commands_failed,
+    poll_duration,
+    diff_size,
+    discovery_duration,
+    bridge_retries,
+    poll_interval,
+    poll_reason,
+    breaker_state
+]
+
+queue_sources = dict()
+
+
+def registerQueueDepths(name: str, get_depths: Callable[[], dict]):
+    # queue depths are read on scrape instead of being tracked on every command
+    queue_sources[name] = get_depths
+
+
+def collectQueueDepths() -> list:
+    lines = ["# HELP {}queue_depth queued commands per device".format(prefix), "# TYPE {}queue_depth gauge".format(prefix)]
+    totals = list()
+    for name, get_depths in list(queue_sources.items()):
+        try:
+            depths = get_depths()
+        except Exception as ex:
+            logger.error("could not read queue depths of '{}' - {}".format(name, ex))
+            continue
+        lines += [
+            "{}queue_depth{} {}".format(prefix, formatLabels(("controller", "device"), (name, device_id)), depth)
+            for device_id, depth in depths.items()
+        ]
+        totals.append((name, sum(depths.values())))
+    lines += ["# HELP {}queue_depth_total queued commands".format(prefix), "# TYPE {}queue_depth_total gauge".format(prefix)]
+    lines += ["{}queue_depth_total{} {}".format(prefix, formatLabels(("controller",), (name,)), total) for name, total in totals]
+    return lines
+
+
+def render() -> str:
+    lines = list()
+    for metric in registry:
+        lines += metric.collect()
+    lines += collectQueueDepths()
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startMetricsServer():
+    if not enabled:
+        return
+    try:
+        server = ThreadingHTTPServer((config.Metrics.host, config.Metrics.port), MetricsHandler)
+    except OSError as ex:
+        logger.error("could not start metrics endpoint - {}".format(ex))
+        return
+    Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("metrics available at 'http://{}:{}/metrics'".format(config.Metrics.host, config.Metrics.port))
@@ -22,34 +22,229 @@ if __name__ == '__main__':
 from .configuration import config
 from .logger import root_logger
 from .device_manager import DeviceManager
+from .transport import getTransport
+from .state_cache import state_cache
+from .event_stream import parseEventStream, getLightNumber, convertResource
+from .event_publisher import EventPublisher
+from .poll_scheduler import PollScheduler
+from .snapshot import DeviceSnapshot
+from .resilience import isRetryable
+from .metrics import poll_duration, diff_size, bridge_errors
 from .types.device import device_type_map
-from threading import Thread
-import time, requests, cc_lib
+from .types.service import registerGamut
+from threading import Thread, Lock
+from typing import Mapping
+import time, json, requests, cc_lib
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
+class HubSync:
+    # all bridges of the process share one hub, a sync before every bridge reported
+    # its devices would remove the devices of the others from the hub
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, bridge_ids):
+        self.__device_manager = device_manager
+        self.__client = client
+        self.__lock = Lock()
+        self.__pending = set(bridge_ids)
+        self.__deferred = False
+
+    def sync(self, bridge_id: str, changed: bool):
+        with self.__lock:
+            if bridge_id in self.__pending:
+                self.__pending.discard(bridge_id)
+                # once every bridge reported the hub is synced at least once with the complete list
+                changed = changed or not self.__pending
+            self.__deferred = self.__deferred or changed
+            if self.__pending or not self.__deferred:
+                return
+            self.__deferred = False
+        try:
+            self.__client.syncHub(list(self.__device_manager.devices.values()), asynchronous=True)
+        except cc_lib.client.HubError:
+            pass
+
+
 class Monitor(Thread):
-    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, bridge_id: str):
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, bridge_id: str, hub_sync: HubSync = None):
         super().__init__(name="monitor-{}".format(bridge_id), daemon=True)
         self.__device_manager = device_manager
         self.__client = client
+        self.__bridge_id = bridge_id
+        self.__hub_sync = hub_sync or HubSync(device_manager, client, (bridge_id,))
+        self.__transport = getTransport(bridge_id)
+        self.__last_event_id = None
+        self.__fingerprints = dict()
+        self.__event_publisher = EventPublisher(client, bridge_id)
+        self.__snapshot = DeviceSnapshot(bridge_id)
+        self.__poll_scheduler = PollScheduler(
+            self.name,
+            config.Monitor.min_poll_interval,
+            config.Monitor.max_poll_interval,
+            config.Monitor.poll_interval
+        )
+        self.__recovered = False
+        self.__transport.breaker.addListener(self.__onBreakerChange)
 
     def run(self):
         logger.info("starting '{}' ...".format(self.name))
+        self.__event_publisher.start()
+        stream_retry_time = 0
         while True:
+            cycle_start = time.monotonic()
+            changes = False
             queried_devices = self.__queryBridge()
+            # a recovery noticed by the query itself needs no extra poll
+            self.__recovered = False
             if queried_devices:
-                self.__evaluate(queried_devices)
-            time.sleep(10)
+                changes = self.__evaluate(queried_devices)
+                devices = self.__devices()
+                for device_id, device in devices.items():
+                    if device_id in queried_devices:
+                        device.touch()
+                self.__snapshot.flush(devices.values())
+                poll_duration.observe(time.monotonic() - cycle_start, self.__bridge_id)
+            if config.Monitor.mode == "stream" and time.time() >= stream_retry_time:
+                if not self.__stream():
+                    logger.warning(
+                        "event stream not available - falling back to polling for {}s".format(
+                            config.Monitor.stream_retry
+                        )
+                    )
+                    stream_retry_time = time.time() + config.Monitor.stream_retry
+                else:
+                    # the stream ended regularly, resync and reconnect after a short pause, the adaptive
+                    # poll interval only applies to the fallback polling
+                    time.sleep(max(config.Monitor.stream_reconnect_delay, 0))
+            else:
+                self.__poll_scheduler.update(
+                    queried_devices is None or self.__transport.breaker.state != "closed",
+                    self.__transport.rate_limiter.last_activity > cycle_start,
+                    changes
+                )
+                self.__wait(cycle_start, time.monotonic() - cycle_start)
+
+    def __wait(self, cycle_start: float, elapsed: float):
+        # sleep in steps of the minimum interval so commands sent meanwhile trigger an early poll
+        remaining = self.__poll_scheduler.delay(elapsed)
+        while remaining > 0:
+            step = min(remaining, self.__poll_scheduler.minimum)
+            time.sleep(step)
+            remaining -= step
+            if self.__transport.rate_limiter.last_activity > cycle_start or self.__recovered:
+                break
+        self.__recovered = False
+
+    def __onBreakerChange(self, state: str):
+        # lights may have changed while the bridge was unavailable, so a recovery triggers an early poll
+        if state == "open":
+            logger.warning("{}: bridge unavailable - failing commands fast".format(self.name))
+        elif state == "closed":
+            logger.info("{}: bridge available again".format(self.name))
+            self.__recovered = True
+
+    def __devices(self) -> Mapping[str, cc_lib.types.Device]:
+        # the device manager is shared by all bridges of the process
+        return self.__device_manager.getByBridge(self.__bridge_id)
+
+    @property
+    def poll_interval(self) -> float:
+        return self.__poll_scheduler.interval
+
+    @property
+    def poll_reason(self) -> str:
+        return self.__poll_scheduler.reason
+
+    @property
+    def breaker_state(self) -> str:
+        return self.__transport.breaker.state
+
+    def __stream(self) -> bool:
+        # returns False if the stream could not be established or closed before stream_min_duration without
+        # a reason, otherwise the caller resynchronizes via a full query and reconnects with the last seen event id
+        resync_time = time.time() + config.Monitor.resync_interval
+        resync = False
+        try:
+            response = self.__transport.openEventStream(self.__last_event_id, config.Monitor.stream_url)
+        except requests.exceptions.RequestException as ex:
+            logger.error("could not open event stream - '{}'".format(ex))
+            return False
+        with response:
+            if response.status_code != 200:
+                logger.error("could not open event stream - '{}'".format(response.status_code))
+                return False
+            logger.debug("event stream connected - last event id: {}".format(self.__last_event_id))
+            state_cache.setLive(self.__bridge_id, True)
+            connect_time = time.monotonic()
+            try:
+                for event_id, data in parseEventStream(response.iter_lines(decode_unicode=True)):
+                    if event_id:
+                        self.__last_event_id = event_id
+                    try:
+                        if self.__handleEvents(json.loads(data)):
+                            resync = True
+                            break
+                    except (json.JSONDecodeError, TypeError, AttributeError) as ex:
+                        logger.error("could not parse event - {}".format(ex))
+                        logger.debug(data)
+                    if time.time() >= resync_time:
+                        resync = True
+                        break
+            except requests.exceptions.RequestException as ex:
+                logger.debug("event stream interrupted - '{}'".format(ex))
+            finally:
+                state_cache.setLive(self.__bridge_id, False)
+        if not resync and time.monotonic() - connect_time < config.Monitor.stream_min_duration:
+            logger.error("event stream closed after {:.1f}s".format(time.monotonic() - connect_time))
+            return False
+        return True
+
+    def __handleEvents(self, events: list) -> bool:
+        # returns True if lights were added or removed and a full query is required
+        updates = dict()
+        for event in events:
+            if event.get("type") in ("add", "delete"):
+                if any(resource.get("type") == "light" for resource in event.get("data", list())):
+                    return True
+            elif event.get("type") == "update":
+                for resource in event.get("data", list()):
+                    number = getLightNumber(resource)
+                    if number:
+                        state = convertResource(resource)
+                        if state:
+                            updates.setdefault(number, dict()).update(state)
+        if updates:
+            self.__applyUpdates(updates)
+        return False
+
+    def __applyUpdates(self, updates: dict):
+        updated_devices = list()
+        for number, update in updates.items():
+            try:
+                device = self.__device_manager.getByNumber(self.__bridge_id, number)
+            except KeyError:
+                continue
+            updated_devices.append(device)
+            prev_device_reachable_state = device.state.reachable
+            device.state = device.state.merge(update)
+            if device.state.reachable != prev_device_reachable_state:
+                if device.state.reachable:
+                    self.__client.connectDevice(device, asynchronous=True)
+                else:
+                    self.__client.disconnectDevice(device, asynchronous=True)
+        self.__event_publisher.publish(updated_devices)
+        if updated_devices:
+            self.__snapshot.save(self.__devices().values())
 
     def __queryBridge(self):
         try:
-            response = requests.get(
-                "https://{}/{}/{}/lights".format(config.Bridge.host, config.Bridge.api_path, config.Bridge.api_key),
-                verify=False
-            )
+            response = self.__transport.getLights()
+            # polls bypass the breaker and act as its health probe
+            if isRetryable(response.status_code, None):
+                self.__transport.breaker.failure()
+            else:
+                self.__transport.breaker.success()
             if response.status_code == 200:
                 response = response.json()
                 devices = dict()
@@ -68,26 +263,64 @@ class Monitor(Thread):
                                 "product_type": device["type"]
                             }
                         )
+                        gamut = device.get("capabilities", dict()).get("control", dict()).get("colorgamut")
+                        if gamut:
+                            registerGamut(device["modelid"], gamut)
                     except KeyError as ex:
                         logger.error("could not parse device - {}".format(ex))
                         logger.debug(device)
                 return devices
             else:
                 logger.error("could not query bridge - '{}'".format(response.status_code))
+                bridge_errors.inc(self.__bridge_id, "get_lights")
         except requests.exceptions.RequestException as ex:
             logger.error("could not query bridge - '{}'".format(ex))
+            bridge_errors.inc(self.__bridge_id, "get_lights")
+            self.__transport.breaker.failure()
 
-    def __diff(self, known: dict, unknown: dict):
+    @staticmethod
+    def __fingerprint(attributes: dict):
+        # reachability is structural because it decides about connecting the device
+        return (
+            hash((attributes["name"], attributes["model"], attributes["number"], attributes["state"].get("reachable"))),
+            hash(json.dumps(attributes["state"], sort_keys=True))
+        )
+
+    def __diff(self, known: set, unknown: dict):
         known_set = set(known)
         unknown_set = set(unknown)
         missing = known_set - unknown_set
         new = unknown_set - known_set
-        changed = {key for key in known_set & unknown_set if dict(known[key]) != unknown[key][0]}
-        return missing, new, changed
+        fingerprints = {key: self.__fingerprint(unknown[key][0]) for key in unknown_set}
+        changed = set()
+        state_changed = set()
+        for key in known_set & unknown_set:
+            known_fingerprint = self.__fingerprints.get(key)
+            if not known_fingerprint or known_fingerprint[0] != fingerprints[key][0]:
+                changed.add(key)
+            elif known_fingerprint[1] != fingerprints[key][1]:
+                state_changed.add(key)
+        return missing, new, changed, state_changed, fingerprints
 
     def __evaluate(self, queried_devices):
-        missing_devices, new_devices, changed_devices = self.__diff(self.__device_manager.devices, queried_devices)
+        missing_devices, new_devices, changed_devices, state_changed_devices, fingerprints = self.__diff(
+            self.__devices().keys(),
+            queried_devices
+        )
+        diff_size.set(len(missing_devices), self.__bridge_id, "missing")
+        diff_size.set(len(new_devices), self.__bridge_id, "new")
+        diff_size.set(len(changed_devices), self.__bridge_id, "changed")
+        diff_size.set(len(state_changed_devices), self.__bridge_id, "state_changed")
         updated_devices = list()
+        state_changed = list()
+        for device_id in state_changed_devices:
+            try:
+                device = self.__device_manager.get(device_id)
+                device.state = queried_devices[device_id][0]["state"]
+                self.__fingerprints[device_id] = fingerprints[device_id]
+                state_changed.append(device)
+            except KeyError:
+                pass
         if missing_devices:
             futures = list()
             for device_id in missing_devices:
@@ -100,6 +333,8 @@ class Monitor(Thread):
                 try:
                     future.result()
                     self.__device_manager.delete(device_id)
+                    self.__fingerprints.pop(device_id, None)
+                    self.__event_publisher.forget(device_id)
                 except cc_lib.client.DeviceDeleteError:
                     try:
                         self.__client.disconnectDevice(device_id)
@@ -109,46 +344,63 @@ class Monitor(Thread):
             futures = list()
             for device_id in new_devices:
                 try:
-                    device = device_type_map[queried_devices[device_id][1]["product_type"]](device_id, **queried_devices[device_id][0])
+                    device = device_type_map[queried_devices[device_id][1]["product_type"]](
+                        device_id,
+                        bridge_id=self.__bridge_id,
+                        **queried_devices[device_id][0]
+                    )
                     logger.info("found '{}' with id '{}'".format(device.name, device.id))
                     futures.append((device, self.__client.addDevice(device, asynchronous=True)))
                 except KeyError:
                     logger.error("can't add '{}' - unsupported device type '{}'".format(device_id, queried_devices[device_id][1]["product_type"]))
+            added_devices = list()
             for device, future in futures:
                 future.wait()
                 try:
                     future.result()
-                    self.__device_manager.add(device)
-                    if device.state["reachable"]:
-                        self.__client.connectDevice(device, asynchronous=True)
+                    added_devices.append(device)
                 except (cc_lib.client.DeviceAddError, cc_lib.client.DeviceUpdateError):
                     pass
+            self.__device_manager.addMany(added_devices)
+            for device in added_devices:
+                self.__fingerprints[device.id] = fingerprints[device.id]
+                if device.state.reachable:
+                    self.__client.connectDevice(device, asynchronous=True)
         if changed_devices:
             futures = list()
+            renumbered = False
             for device_id in changed_devices:
                 device = self.__device_manager.get(device_id)
                 prev_device_name = device.name
-                prev_device_reachable_state = device.state["reachable"]
+                prev_device_reachable_state = device.state.reachable
                 device.name = queried_devices[device_id][0]["name"]
                 device.model = queried_devices[device_id][0]["model"]
                 device.state = queried_devices[device_id][0]["state"]
-                device.number = queried_devices[device_id][0]["number"]
-                if device.state["reachable"] != prev_device_reachable_state:
-                    if device.state["reachable"]:
+                if device.number != queried_devices[device_id][0]["number"]:
+                    device.number = queried_devices[device_id][0]["number"]
+                    renumbered = True
+                state_changed.append(device)
+                if device.state.reachable != prev_device_reachable_state:
+                    if device.state.reachable:
                         self.__client.connectDevice(device, asynchronous=True)
                     else:
                         self.__client.disconnectDevice(device, asynchronous=True)
                 if device.name != prev_device_name:
                     futures.append((device, prev_device_name, self.__client.updateDevice(device, asynchronous=True)))
+                else:
+                    self.__fingerprints[device_id] = fingerprints[device_id]
+            if renumbered:
+                self.__device_manager.reindex()
             for device, prev_device_name, future in futures:
                 future.wait()
                 try:
                     future.result()
                     updated_devices.append(device.id)
+                    self.__fingerprints[device.id] = fingerprints[device.id]
                 except cc_lib.client.DeviceUpdateError:
                     device.name = prev_device_name
-        if any((missing_devices, new_devices, updated_devices)):
-            try:
-                self.__client.syncHub(list(self.__device_manager.devices.values()), asynchronous=True)
-            except cc_lib.client.HubError:
-                pass
+        self.__event_publisher.publish(state_changed)
+        if any((missing_devices, new_devices, changed_devices, state_changed_devices)):
+            self.__snapshot.save(self.__devices().values(), force=bool(missing_devices or new_devices or changed_devices))
+        self.__hub_sync.sync(self.__bridge_id, any((missing_devices, new_devices, updated_devices)))
+        return any((missing_devices, new_devices, changed_devices, state_changed_devices))
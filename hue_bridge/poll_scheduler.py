@@ -0,0 +1,77 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .logger import root_logger
+from .metrics import poll_interval, poll_reason
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class PollScheduler:
+    def __init__(self, name: str, minimum: float, maximum: float, initial: float):
+        self.__name = name
+        self.__minimum = minimum
+        self.__maximum = max(maximum, minimum)
+        self.__interval = min(max(initial, self.__minimum), self.__maximum)
+        self.__reason = "initial"
+        self.__export(None)
+
+    @property
+    def minimum(self) -> float:
+        return self.__minimum
+
+    @property
+    def interval(self) -> float:
+        return self.__interval
+
+    @property
+    def reason(self) -> str:
+        return self.__reason
+
+    def update(self, error: bool, commands: bool, changes: bool) -> float:
+        if error:
+            interval, reason = self.__interval * 2, "bridge error"
+        elif commands:
+            interval, reason = self.__minimum, "commands sent"
+        elif changes:
+            interval, reason = self.__interval / 2, "changes detected"
+        else:
+            interval, reason = self.__interval * 1.5, "quiet"
+        interval = min(max(interval, self.__minimum), self.__maximum)
+        if interval != self.__interval:
+            logger.debug("{}: poll interval {:.1f}s -> {:.1f}s - {}".format(self.__name, self.__interval, interval, reason))
+        previous = self.__reason
+        self.__interval = interval
+        self.__reason = reason
+        self.__export(previous)
+        return interval
+
+    def __export(self, previous_reason):
+        poll_interval.set(self.__interval, self.__name)
+        if previous_reason != self.__reason:
+            if previous_reason:
+                poll_reason.set(0, self.__name, previous_reason)
+            poll_reason.set(1, self.__name, self.__reason)
+
+    def delay(self, elapsed: float) -> float:
+        # time spent querying and evaluating counts towards the interval so cycles don't drift
+        return max(self.__interval - elapsed, 0.0)
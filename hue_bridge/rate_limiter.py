@@ -0,0 +1,82 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from threading import Lock
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__last = time.monotonic()
+        self.__last_reserve = 0.0
+        self.__lock = Lock()
+
+    def __refill(self, now: float):
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+        self.__last = now
+
+    def reserve(self) -> float:
+        # take a token right away and return how long the caller has to wait for it,
+        # so concurrent callers are served in arrival order without polling
+        with self.__lock:
+            self.__refill(time.monotonic())
+            self.__last_reserve = self.__last
+            self.__tokens -= 1
+            return -self.__tokens / self.__rate if self.__tokens < 0 else 0.0
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def tryAcquire(self) -> bool:
+        with self.__lock:
+            self.__refill(time.monotonic())
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return True
+            return False
+
+    @property
+    def last_reserve(self) -> float:
+        return self.__last_reserve
+
+    @property
+    def tokens(self) -> float:
+        with self.__lock:
+            self.__refill(time.monotonic())
+            return self.__tokens
+
+
+class RateLimiter:
+    def __init__(self, light_rate: float, light_burst: int, group_rate: float, group_burst: int):
+        self.light = TokenBucket(light_rate, light_burst)
+        self.group = TokenBucket(group_rate, group_burst)
+
+    @property
+    def last_activity(self) -> float:
+        return max(self.light.last_reserve, self.group.last_reserve)
@@ -0,0 +1,175 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .metrics import breaker_state, bridge_retries
+from threading import Lock
+from contextvars import ContextVar
+from requests import exceptions
+from typing import Callable
+import time, random
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+# deadline of the commands the current worker is serving, retries must not outlive it
+command_deadline = ContextVar("command_deadline", default=None)
+
+# 'internal error' of the hue api, the bridge is overloaded or still starting
+retry_error_types = (901,)
+retry_status_codes = (429, 502, 503, 504)
+
+breaker_states = {"closed": 0, "half-open": 1, "open": 2}
+
+
+def bindDeadline(commands):
+    timestamps = [command.timestamp for command in commands]
+    if not timestamps:
+        return None
+    return command_deadline.set(min(timestamps) + config.Controller.max_command_age)
+
+
+def unbindDeadline(token):
+    if token is not None:
+        command_deadline.reset(token)
+
+
+def getDeadline() -> float:
+    return command_deadline.get() or time.time() + config.Resilience.default_budget
+
+
+def isRetryable(status_code: int, resp) -> bool:
+    if status_code in retry_status_codes:
+        return True
+    try:
+        return isinstance(resp, list) and resp[0]["error"]["type"] in retry_error_types
+    except (IndexError, KeyError, TypeError):
+        return False
+
+
+def getBackoff(attempt: int) -> float:
+    # full jitter, so queued commands don't hit a recovering bridge in lockstep
+    return random.uniform(0, min(config.Resilience.max_backoff, config.Resilience.base_backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.__name = name
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__lock = Lock()
+        self.__state = "closed"
+        self.__failures = 0
+        self.__open_until = 0.0
+        self.__probing = False
+        self.__listeners = list()
+        breaker_state.set(breaker_states[self.__state], name)
+
+    def __setState(self, state: str):
+        # called with the lock held, listeners run after it is released
+        if state == self.__state:
+            return None
+        logger.info("circuit breaker of '{}': {} -> {}".format(self.__name, self.__state, state))
+        self.__state = state
+        breaker_state.set(breaker_states[state], self.__name)
+        return list(self.__listeners)
+
+    def __notify(self, listeners, state: str):
+        for listener in listeners or ():
+            try:
+                listener(state)
+            except Exception as ex:
+                logger.error("circuit breaker listener failed - {}".format(ex))
+
+    def allow(self) -> bool:
+        # while open requests fail fast, after the reset timeout a single probe is let through
+        with self.__lock:
+            if self.__state == "closed":
+                return True
+            listeners = None
+            if self.__state == "open":
+                if time.monotonic() < self.__open_until:
+                    return False
+                listeners = self.__setState("half-open")
+            if self.__probing:
+                return False
+            self.__probing = True
+        self.__notify(listeners, "half-open")
+        return True
+
+    def success(self):
+        with self.__lock:
+            self.__failures = 0
+            self.__probing = False
+            listeners = self.__setState("closed")
+        self.__notify(listeners, "closed")
+
+    def failure(self):
+        with self.__lock:
+            self.__failures += 1
+            self.__probing = False
+            if self.__state == "half-open" or self.__failures >= self.__failure_threshold:
+                self.__open_until = time.monotonic() + self.__reset_timeout
+                listeners = self.__setState("open")
+            else:
+                listeners = None
+        self.__notify(listeners, "open")
+
+    def addListener(self, listener: Callable[[str], None]):
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def state(self) -> str:
+        return self.__state
+
+
+def callWithRetry(breaker: CircuitBreaker, request: Callable, evaluate: Callable, operation: str) -> tuple:
+    # retries transport errors and overload answers with jittered backoff as long as the deadline allows,
+    # other bridge errors mean the bridge is up and are returned right away
+    deadline = getDeadline()
+    attempt = 0
+    err, body = True, "hue bridge unavailable"
+    while True:
+        if not breaker.allow():
+            return err, body
+        try:
+            resp = request()
+            payload = resp.json() if resp.status_code == 200 else None
+            err, body = evaluate(resp.status_code, payload)
+            retry = err and isRetryable(resp.status_code, payload)
+        except exceptions.RequestException:
+            err, body, retry = True, "could not send request to hue bridge", True
+        if not retry:
+            breaker.success()
+            return err, body
+        breaker.failure()
+        attempt += 1
+        backoff = getBackoff(attempt)
+        if attempt >= config.Resilience.max_attempts or time.time() + backoff >= deadline:
+            return err, body
+        bridge_retries.inc(breaker.name, operation)
+        time.sleep(backoff)
@@ -0,0 +1,80 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .logger import root_logger
+from .device_manager import DeviceManager
+from .metrics import commands_dropped
+from threading import Thread
+from queue import Queue, Empty
+import cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class BridgeClient:
+    # view on the shared client for one bridge, commands arrive through the router instead of the hub
+    def __init__(self, client: cc_lib.client.Client, bridge_id: str):
+        self.__client = client
+        self.__bridge_id = bridge_id
+        self.__command_queue = Queue()
+
+    def __getattr__(self, name):
+        return getattr(self.__client, name)
+
+    def put(self, command):
+        self.__command_queue.put_nowait(command)
+
+    def receiveCommand(self, timeout: float = None):
+        try:
+            return self.__command_queue.get(timeout=timeout)
+        except Empty:
+            raise cc_lib.client.CommandQueueEmptyError
+
+    @property
+    def bridge_id(self) -> str:
+        return self.__bridge_id
+
+
+class CommandRouter(Thread):
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client):
+        super().__init__(name="command-router", daemon=True)
+        self.__device_manager = device_manager
+        self.__client = client
+        self.__routes = dict()
+
+    def getClient(self, bridge_id: str) -> BridgeClient:
+        if bridge_id not in self.__routes:
+            self.__routes[bridge_id] = BridgeClient(self.__client, bridge_id)
+        return self.__routes[bridge_id]
+
+    def run(self):
+        logger.info("starting '{}' for {} bridges ...".format(self.name, len(self.__routes)))
+        while True:
+            try:
+                command = self.__client.receiveCommand(timeout=30)
+                try:
+                    self.__routes[self.__device_manager.get(command.device_id).bridge_id].put(command)
+                except KeyError:
+                    logger.error("received command for unknown device '{}'".format(command.device_id))
+                    commands_dropped.inc("unknown_device")
+            except cc_lib.client.CommandQueueEmptyError:
+                pass
@@ -0,0 +1,119 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .fan_out import GroupAction
+from threading import Condition
+from collections import deque
+from itertools import count
+import heapq
+
+
+def getDeadline(item) -> float:
+    # group markers hold up the other members of their group, they go first
+    if isinstance(item, GroupAction):
+        return 0.0
+    return item.timestamp + config.Controller.max_command_age
+
+
+class DeadlineScheduler:
+    # keeps one queue per device and hands out devices by the deadline of their oldest command,
+    # a device is served by one worker at a time so its commands stay in order. Deadlines within
+    # the same fairness window count as equal and devices with fewer consecutive turns go first,
+    # so a backlog doesn't starve devices with commands of about the same age
+    def __init__(self):
+        self.__condition = Condition()
+        self.__devices = dict()
+        self.__queues = dict()
+        self.__heap = list()
+        self.__sequence = count()
+        self.__ready = set()
+        self.__active = set()
+        self.__blocked = set()
+        self.__turns = dict()
+
+    def __push(self, device_id: str):
+        deadline = getDeadline(self.__queues[device_id][0])
+        window = deadline // config.Controller.fairness_window if config.Controller.fairness_window > 0 else deadline
+        self.__ready.add(device_id)
+        heapq.heappush(
+            self.__heap,
+            (window, self.__turns.get(device_id, 0), deadline, next(self.__sequence), device_id)
+        )
+        self.__condition.notify()
+
+    def put(self, device, item):
+        with self.__condition:
+            queue = self.__queues.get(device.id)
+            if queue is None:
+                queue = self.__queues[device.id] = deque()
+            queue.append(item)
+            self.__devices[device.id] = device
+            if len(queue) == 1 and device.id not in self.__active and device.id not in self.__blocked:
+                self.__push(device.id)
+
+    def take(self) -> tuple:
+        # blocks until a device is ready, the caller owns the device until it calls release
+        with self.__condition:
+            while not self.__heap:
+                self.__condition.wait()
+            device_id = heapq.heappop(self.__heap)[-1]
+            self.__ready.discard(device_id)
+            self.__active.add(device_id)
+            items = list(self.__queues.pop(device_id))
+            return self.__devices.pop(device_id), items
+
+    def release(self, device, remaining: list, action: GroupAction = None):
+        # unprocessed items go back in front of the ones that arrived meanwhile, with an unfinished
+        # group action the device stays blocked until the group request is done
+        with self.__condition:
+            self.__active.discard(device.id)
+            if remaining:
+                queue = self.__queues.get(device.id)
+                self.__queues[device.id] = deque(remaining) + queue if queue else deque(remaining)
+            if device.id in self.__queues:
+                self.__devices[device.id] = device
+            if device.id in self.__queues:
+                self.__turns[device.id] = self.__turns.get(device.id, 0) + 1
+            else:
+                self.__turns.pop(device.id, None)
+            if action:
+                self.__blocked.add(device.id)
+            elif device.id in self.__queues:
+                self.__push(device.id)
+        if action:
+            action.addDoneCallback(lambda: self.__unblock(device.id))
+
+    def __unblock(self, device_id: str):
+        with self.__condition:
+            self.__blocked.discard(device_id)
+            if device_id in self.__queues and device_id not in self.__active and device_id not in self.__ready:
+                self.__push(device_id)
+
+    @property
+    def queue_depth(self) -> int:
+        with self.__condition:
+            return sum(len(queue) for queue in self.__queues.values())
+
+    @property
+    def queue_depths(self) -> dict:
+        with self.__condition:
+            return {device_id: len(queue) for device_id, queue in self.__queues.items()}
@@ -0,0 +1,181 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "supervisor.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .bridges import loadBridges
+from .connector import Connector
+from .snapshot import getRecord
+from threading import Thread, Event, Lock
+from queue import Queue, Empty
+from itertools import count
+import os, time, resource, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class ShardCommand:
+    # picklable copy of the fields workers use, the supervisor keeps the original envelope
+    def __init__(self, key: int, command):
+        self.key = key
+        self.correlation_id = command.correlation_id
+        self.device_id = command.device_id
+        self.service_uri = command.service_uri
+        self.completion_strategy = command.completion_strategy
+        self.timestamp = command.timestamp
+        self.data = command.message.data
+        self.message = None
+
+    def __str__(self):
+        return "correlation_id: {}, device_id: {}, service_uri: {}".format(
+            self.correlation_id,
+            self.device_id,
+            self.service_uri
+        )
+
+
+class ShardFuture:
+    def __init__(self):
+        self.__event = Event()
+        self.__error = None
+
+    def set(self, error: tuple = None):
+        self.__error = error
+        self.__event.set()
+
+    def done(self) -> bool:
+        return self.__event.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.__event.wait(timeout)
+
+    def result(self):
+        self.__event.wait()
+        if self.__error:
+            name, message = self.__error
+            raise getattr(cc_lib.client, name, Exception)(message)
+
+
+class ShardClient:
+    # stands in for the cc_lib client inside a shard process, calls are forwarded to the supervisor
+    def __init__(self, name: str, inbound, outbound):
+        self.__name = name
+        self.__inbound = inbound
+        self.__outbound = outbound
+        self.__command_queue = Queue()
+        self.__futures = dict()
+        self.__futures_lock = Lock()
+        self.__call_ids = count()
+        self.__connect_clbk = None
+        self.__reader = Thread(target=self.__read, name="shard-reader-{}".format(name), daemon=True)
+        self.__reader.start()
+
+    def __read(self):
+        while True:
+            message = self.__inbound.get()
+            if message[0] == "command":
+                command = message[1]
+                command.message = cc_lib.client.message.Message(command.data)
+                self.__command_queue.put(command)
+            elif message[0] == "reply":
+                with self.__futures_lock:
+                    future = self.__futures.pop(message[1], None)
+                if future:
+                    future.set(message[2])
+            elif message[0] == "reconnect" and self.__connect_clbk:
+                self.__connect_clbk(self)
+
+    def __call(self, method: str, arg, asynchronous: bool):
+        future = ShardFuture()
+        call_id = next(self.__call_ids)
+        with self.__futures_lock:
+            self.__futures[call_id] = future
+        self.__outbound.put(("call", self.__name, call_id, method, getRecord(arg) if hasattr(arg, "id") else arg))
+        if asynchronous:
+            return future
+        future.result()
+
+    def setConnectClbk(self, func):
+        self.__connect_clbk = func
+
+    def receiveCommand(self, timeout: float = None):
+        try:
+            return self.__command_queue.get(timeout=timeout)
+        except Empty:
+            raise cc_lib.client.CommandQueueEmptyError
+
+    def sendResponse(self, command: ShardCommand, asynchronous: bool = False):
+        self.__outbound.put(("response", self.__name, command.key, command.message.data))
+
+    def emmitEvent(self, envelope, asynchronous: bool = False):
+        self.__outbound.put(("event", self.__name, envelope.device_id, envelope.service_uri, envelope.message.data))
+
+    def addDevice(self, device, asynchronous: bool = False):
+        return self.__call("addDevice", device, asynchronous)
+
+    def updateDevice(self, device, asynchronous: bool = False):
+        return self.__call("updateDevice", device, asynchronous)
+
+    def deleteDevice(self, device, asynchronous: bool = False):
+        return self.__call("deleteDevice", device, asynchronous)
+
+    def connectDevice(self, device, asynchronous: bool = False):
+        return self.__call("connectDevice", device, asynchronous)
+
+    def disconnectDevice(self, device, asynchronous: bool = False):
+        return self.__call("disconnectDevice", device, asynchronous)
+
+    def syncHub(self, devices, asynchronous: bool = False):
+        self.__outbound.put(("sync", self.__name, [getRecord(device) for device in devices]))
+
+    def heartbeat(self, stats: dict):
+        self.__outbound.put(("heartbeat", self.__name, stats))
+
+
+def sendHeartbeats(client: ShardClient, connector: Connector):
+    cpu_time = time.process_time()
+    while True:
+        time.sleep(config.Supervisor.heartbeat)
+        now = time.process_time()
+        client.heartbeat(
+            {
+                "devices": len(connector.device_manager.devices),
+                "queue_depth": connector.queue_depth,
+                "cpu": round((now - cpu_time) / config.Supervisor.heartbeat, 3),
+                "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "poll_intervals": connector.poll_intervals,
+                "breaker_states": connector.breaker_states
+            }
+        )
+        cpu_time = now
+
+
+def runShard(name: str, bridge_ids: list, inbound, outbound):
+    # entry point of a shard process, heartbeats start before discovery so a slow discovery doesn't look like a hang
+    client = ShardClient(name, inbound, outbound)
+    connector = Connector(client, [bridge for bridge in loadBridges() if bridge.id in bridge_ids])
+    client.setConnectClbk(connector.onConnect)
+    Thread(target=sendHeartbeats, name="shard-heartbeat-{}".format(name), args=(client, connector), daemon=True).start()
+    connector.discover()
+    connector.start()
+    logger.info("shard '{}' running with pid {} for {}".format(name, os.getpid(), ", ".join(bridge_ids)))
+    connector.join()
@@ -0,0 +1,111 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config, user_dir
+from .logger import root_logger
+from .types.device import device_type_map
+from threading import Lock
+from os import replace as os_replace
+from os.path import join as path_join
+import time, json
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+product_type_map = {device_class: product_type for product_type, device_class in device_type_map.items()}
+
+
+def getRecord(device) -> dict:
+    return {
+        "id": device.id,
+        "type": product_type_map[type(device)],
+        "name": device.name,
+        "model": device.model,
+        "number": device.number,
+        "state": device.state.toDict(),
+        "bridge_id": device.bridge_id
+    }
+
+
+def getDevice(record: dict, bridge_id: str = None):
+    return device_type_map[record["type"]](
+        record["id"],
+        record["name"],
+        record["model"],
+        record["state"],
+        record["number"],
+        bridge_id or record.get("bridge_id")
+    )
+
+
+class DeviceSnapshot:
+    def __init__(self, bridge_id: str):
+        self.__bridge_id = bridge_id
+        self.__path = path_join(user_dir, "devices-{}.json".format(bridge_id))
+        self.__lock = Lock()
+        self.__dirty = False
+        self.__save_time = 0
+
+    def load(self) -> list:
+        devices = list()
+        try:
+            with open(self.__path) as file:
+                records = json.load(file)
+            for record in records:
+                try:
+                    device = getDevice(record, self.__bridge_id)
+                    # saved states may be arbitrarily old, the first status query has to ask the bridge
+                    device.expire()
+                    devices.append(device)
+                except (KeyError, TypeError) as ex:
+                    logger.warning("could not restore device - {}".format(ex))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as ex:
+            logger.warning("could not load device snapshot - {}".format(ex))
+        return devices
+
+    def save(self, devices, force: bool = False):
+        if not config.Snapshot.enabled:
+            return
+        # state changes only mark the snapshot dirty, it is written at most every Snapshot.interval seconds
+        with self.__lock:
+            self.__dirty = True
+            if force or time.monotonic() - self.__save_time >= config.Snapshot.interval:
+                self.__write(devices)
+
+    def flush(self, devices):
+        if not config.Snapshot.enabled:
+            return
+        with self.__lock:
+            if self.__dirty and time.monotonic() - self.__save_time >= config.Snapshot.interval:
+                self.__write(devices)
+
+    def __write(self, devices):
+        records = [getRecord(device) for device in devices]
+        try:
+            with open("{}.tmp".format(self.__path), "w") as file:
+                json.dump(records, file)
+            os_replace("{}.tmp".format(self.__path), self.__path)
+            self.__dirty = False
+            self.__save_time = time.monotonic()
+        except OSError as ex:
+            logger.warning("could not save device snapshot - {}".format(ex))
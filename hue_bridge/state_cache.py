@@ -0,0 +1,81 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from threading import Lock
+import time
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class StateCache:
+    def __init__(self, report_interval: int = 300):
+        self.__live = set()
+        self.__lock = Lock()
+        self.__report_interval = report_interval
+        self.__report_time = time.monotonic()
+        self.__hits = 0
+        self.__misses = 0
+        self.__age_sum = 0.0
+
+    def setLive(self, bridge_id: str, live: bool):
+        # while the monitor is attached to the event stream every device state is current
+        with self.__lock:
+            if live:
+                self.__live.add(bridge_id)
+            else:
+                self.__live.discard(bridge_id)
+
+    def isFresh(self, bridge_id: str, device) -> bool:
+        age = 0.0 if bridge_id in self.__live else device.state_age
+        fresh = age <= config.Controller.max_state_age
+        with self.__lock:
+            if fresh:
+                self.__hits += 1
+                self.__age_sum += age
+            else:
+                self.__misses += 1
+            if time.monotonic() - self.__report_time >= self.__report_interval:
+                self.__report()
+        logger.debug("state of '{}' {} - age: {:.1f}s".format(device.id, "cached" if fresh else "stale", age))
+        return fresh
+
+    def __report(self):
+        logger.info("state cache - hits: {} misses: {} average age: {:.1f}s".format(
+            self.__hits,
+            self.__misses,
+            self.__age_sum / self.__hits if self.__hits else 0.0
+        ))
+        self.__report_time = time.monotonic()
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "average_age": self.__age_sum / self.__hits if self.__hits else 0.0
+            }
+
+
+state_cache = StateCache()
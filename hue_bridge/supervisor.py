@@ -0,0 +1,286 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "supervisor.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .device_manager import DeviceManager
+from .monitor import HubSync
+from .snapshot import DeviceSnapshot, getDevice
+from .shard import ShardCommand, runShard
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import os, time, multiprocessing, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class Shard:
+    def __init__(self, name: str, bridge_ids: list, context, outbound):
+        self.name = name
+        self.bridge_ids = bridge_ids
+        self.inbound = context.Queue()
+        self.restarts = 0
+        self.commands = 0
+        self.stats = dict()
+        self.heartbeat_time = 0
+        self.__context = context
+        self.__outbound = outbound
+        self.__process = None
+        self.__start_time = 0
+        self.__restart_time = None
+        self.__restart_delay = config.Supervisor.restart_delay
+
+    def start(self):
+        self.__process = self.__context.Process(
+            target=runShard,
+            name="shard-{}".format(self.name),
+            args=(self.name, self.bridge_ids, self.inbound, self.__outbound),
+            daemon=True
+        )
+        self.__process.start()
+        self.__start_time = self.heartbeat_time = time.monotonic()
+        self.__restart_time = None
+
+    def check(self):
+        # restarts crashed or hung shards, the delay doubles while a shard keeps crashing shortly after its start
+        now = time.monotonic()
+        if self.__restart_time is not None:
+            if now >= self.__restart_time:
+                logger.info("restarting shard '{}'".format(self.name))
+                self.restarts += 1
+                self.start()
+            return
+        if self.__process.is_alive():
+            if now - self.heartbeat_time < config.Supervisor.heartbeat * 3:
+                return
+            logger.error("shard '{}' missed its heartbeats - terminating".format(self.name))
+            self.__process.terminate()
+            self.__process.join(5)
+        else:
+            logger.error("shard '{}' exited with code {}".format(self.name, self.__process.exitcode))
+        if now - self.__start_time > config.Supervisor.max_restart_delay:
+            self.__restart_delay = config.Supervisor.restart_delay
+        self.__restart_time = now + self.__restart_delay
+        self.__restart_delay = min(self.__restart_delay * 2, config.Supervisor.max_restart_delay)
+
+    @property
+    def alive(self) -> bool:
+        return self.__process is not None and self.__process.is_alive()
+
+    @property
+    def pid(self) -> int:
+        return self.__process.pid if self.__process else None
+
+
+class Supervisor(Thread):
+    def __init__(self, client: cc_lib.client.Client, bridges: list):
+        super().__init__(name="supervisor", daemon=True)
+        self.__client = client
+        context = multiprocessing.get_context("spawn")
+        self.__outbound = context.Queue()
+        shard_count = max(1, min(config.Supervisor.shards or os.cpu_count() or 1, len(bridges)))
+        self.__shards = dict()
+        self.__bridge_map = dict()
+        for number in range(shard_count):
+            bridge_ids = [bridge.id for bridge in bridges[number::shard_count]]
+            shard = Shard(str(number), bridge_ids, context, self.__outbound)
+            self.__shards[shard.name] = shard
+            for bridge_id in bridge_ids:
+                self.__bridge_map[bridge_id] = shard
+        # mirror of the devices of all shards, used for routing, hub calls and the merged hub sync
+        self.__device_manager = DeviceManager()
+        for bridge in bridges:
+            self.__device_manager.addMany(DeviceSnapshot(bridge.id).load())
+        self.__hub_sync = HubSync(self.__device_manager, client, self.__shards.keys())
+        # calls of a device always go to the same single thread executor so they run in the order they were sent
+        self.__executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="supervisor-call-{}".format(number))
+            for number in range(4)
+        ]
+        self.__pending = dict()
+        self.__pending_lock = Lock()
+        self.__keys = count()
+        self.__report_time = time.monotonic()
+
+    def run(self):
+        logger.info("starting '{}' with {} shards ...".format(self.name, len(self.__shards)))
+        for shard in self.__shards.values():
+            shard.start()
+        Thread(target=self.__read, name="supervisor-reader", daemon=True).start()
+        Thread(target=self.__route, name="supervisor-router", daemon=True).start()
+        while True:
+            time.sleep(1)
+            for shard in self.__shards.values():
+                shard.check()
+            self.__collectGarbage()
+            if time.monotonic() - self.__report_time >= config.Supervisor.heartbeat * 6:
+                self.__report()
+                self.__report_time = time.monotonic()
+
+    def onConnect(self, client: cc_lib.client.Client):
+        for shard in self.__shards.values():
+            shard.inbound.put(("reconnect",))
+
+    def __route(self):
+        while True:
+            try:
+                command = self.__client.receiveCommand(timeout=30)
+                try:
+                    shard = self.__bridge_map[self.__device_manager.get(command.device_id).bridge_id]
+                except KeyError:
+                    logger.error("received command for unknown device '{}'".format(command.device_id))
+                    continue
+                key = next(self.__keys)
+                if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
+                    with self.__pending_lock:
+                        self.__pending[key] = (command, time.monotonic())
+                shard.inbound.put(("command", ShardCommand(key, command)))
+                shard.commands += 1
+            except cc_lib.client.CommandQueueEmptyError:
+                pass
+
+    def __read(self):
+        while True:
+            message = self.__outbound.get()
+            try:
+                kind, shard = message[0], self.__shards[message[1]]
+                if kind == "response":
+                    self.__respond(message[2], message[3])
+                elif kind == "event":
+                    self.__emit(message[2], message[3], message[4])
+                elif kind == "call":
+                    device_id = message[4]["id"] if isinstance(message[4], dict) else message[4]
+                    executor = self.__executors[hash(device_id) % len(self.__executors)]
+                    executor.submit(self.__call, shard, message[2], message[3], message[4])
+                elif kind == "sync":
+                    self.__sync(shard, message[2])
+                elif kind == "heartbeat":
+                    shard.stats = message[2]
+                    shard.heartbeat_time = time.monotonic()
+            except Exception as ex:
+                logger.error("could not handle shard message '{}' - {}".format(message[0], ex))
+
+    def __respond(self, key: int, data: str):
+        with self.__pending_lock:
+            command, _ = self.__pending.pop(key, (None, None))
+        if command:
+            command.message = cc_lib.client.message.Message(data)
+            self.__client.sendResponse(command, asynchronous=True)
+
+    def __emit(self, device_id: str, service_uri: str, data: str):
+        try:
+            device = self.__device_manager.get(device_id)
+        except KeyError:
+            return
+        try:
+            self.__client.emmitEvent(
+                cc_lib.client.message.EventEnvelope(device, service_uri, cc_lib.client.message.Message(data)),
+                asynchronous=True
+            )
+        except cc_lib.client.NotConnectedError:
+            pass
+
+    def __mirror(self, record: dict):
+        # keeps one device object per id so the client always sees the same instance
+        try:
+            device = self.__device_manager.get(record["id"])
+            device.name = record["name"]
+            device.model = record["model"]
+            if device.number != record["number"]:
+                device.number = record["number"]
+                self.__device_manager.reindex()
+            device.state = record["state"]
+        except KeyError:
+            device = getDevice(record)
+        return device
+
+    def __call(self, shard: Shard, call_id: int, method: str, arg):
+        error = None
+        try:
+            target = self.__mirror(arg) if isinstance(arg, dict) else arg
+            getattr(self.__client, method)(target)
+            if method == "addDevice":
+                self.__device_manager.add(target)
+            elif method == "deleteDevice":
+                self.__device_manager.delete(target)
+        except Exception as ex:
+            error = (type(ex).__name__, str(ex))
+        shard.inbound.put(("reply", call_id, error))
+
+    def __sync(self, shard: Shard, records: list):
+        known = {record["id"] for record in records}
+        for device_id, device in self.__device_manager.devices.items():
+            if device.bridge_id in shard.bridge_ids and device_id not in known:
+                self.__device_manager.delete(device_id)
+        devices = self.__device_manager.devices
+        added_devices = list()
+        for record in records:
+            device = self.__mirror(record)
+            if record["id"] not in devices:
+                added_devices.append(device)
+        self.__device_manager.addMany(added_devices)
+        self.__hub_sync.sync(shard.name, True)
+
+    def __collectGarbage(self):
+        # responses of commands that were dropped or lost with a crashed shard never arrive
+        limit = time.monotonic() - config.Controller.max_command_age * 2
+        with self.__pending_lock:
+            for key in [key for key, (_, timestamp) in self.__pending.items() if timestamp < limit]:
+                del self.__pending[key]
+
+    def __report(self):
+        for shard in self.__shards.values():
+            logger.info(
+                "shard '{}': pid={} alive={} restarts={} bridges={} commands={} devices={} queue_depth={} cpu={} max_rss={}".format(
+                    shard.name,
+                    shard.pid,
+                    shard.alive,
+                    shard.restarts,
+                    len(shard.bridge_ids),
+                    shard.commands,
+                    shard.stats.get("devices"),
+                    shard.stats.get("queue_depth"),
+                    shard.stats.get("cpu"),
+                    shard.stats.get("max_rss")
+                )
+            )
+
+    @property
+    def device_manager(self) -> DeviceManager:
+        return self.__device_manager
+
+    @property
+    def health(self) -> dict:
+        now = time.monotonic()
+        return {
+            shard.name: {
+                "pid": shard.pid,
+                "alive": shard.alive,
+                "restarts": shard.restarts,
+                "bridges": list(shard.bridge_ids),
+                "commands": shard.commands,
+                "heartbeat_age": round(now - shard.heartbeat_time, 1),
+                **shard.stats
+            }
+            for shard in self.__shards.values()
+        }
@@ -0,0 +1,138 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config, user_dir
+from .logger import root_logger
+from threading import Lock
+from collections import deque
+from contextvars import ContextVar
+from os.path import join as path_join
+import time, json, random
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+# traces of the commands the current worker is serving, lets the bridge call mark them without passing them down
+current_traces = ContextVar("current_traces", default=())
+
+
+class Trace:
+    __slots__ = ("correlation_id", "device_id", "service_uri", "created", "stages")
+
+    def __init__(self, command):
+        self.correlation_id = command.correlation_id
+        self.device_id = command.device_id
+        self.service_uri = command.service_uri
+        self.created = command.timestamp
+        self.stages = list()
+
+    def mark(self, stage: str):
+        self.stages.append((stage, time.time()))
+
+    def toDict(self, outcome: str) -> dict:
+        return {
+            "correlation_id": self.correlation_id,
+            "device_id": self.device_id,
+            "service": self.service_uri,
+            "outcome": outcome,
+            "created": self.created,
+            "stages": [[stage, round((timestamp - self.created) * 1000, 3)] for stage, timestamp in self.stages],
+            "total_ms": round((self.stages[-1][1] - self.created) * 1000, 3) if self.stages else 0
+        }
+
+
+class Tracer:
+    def __init__(self, sample_rate: float, buffer_size: int, path: str = None):
+        self.__enabled = sample_rate > 0
+        self.__sample_rate = sample_rate
+        self.__buffer_size = buffer_size
+        self.__lock = Lock()
+        self.__active = dict()
+        self.__recent = deque(maxlen=buffer_size)
+        self.__file = None
+        if self.__enabled and path:
+            try:
+                self.__file = open(path_join(user_dir, path), "a", buffering=1)
+            except OSError as ex:
+                logger.error("could not open trace file - {}".format(ex))
+
+    def begin(self, command):
+        if not self.__enabled or random.random() >= self.__sample_rate:
+            return
+        trace = Trace(command)
+        trace.mark("received")
+        with self.__lock:
+            self.__active[command.correlation_id] = trace
+            # commands that never get an answer must not pile up
+            if len(self.__active) > self.__buffer_size:
+                self.__active.pop(next(iter(self.__active)))
+
+    def mark(self, command, stage: str):
+        if not self.__enabled:
+            return
+        trace = self.__active.get(command.correlation_id)
+        if trace:
+            trace.mark(stage)
+
+    def finish(self, command, outcome: str = "ok"):
+        if not self.__enabled:
+            return
+        with self.__lock:
+            trace = self.__active.pop(command.correlation_id, None)
+        if not trace:
+            return
+        trace.mark(outcome)
+        record = trace.toDict(outcome)
+        with self.__lock:
+            self.__recent.append(record)
+            if self.__file:
+                try:
+                    self.__file.write(json.dumps(record) + "\n")
+                except OSError as ex:
+                    logger.error("could not write trace - {}".format(ex))
+
+    def bind(self, commands):
+        if not self.__enabled:
+            return None
+        traces = tuple(trace for trace in (self.__active.get(command.correlation_id) for command in commands) if trace)
+        return current_traces.set(traces) if traces else None
+
+    def unbind(self, token):
+        if token is not None:
+            current_traces.reset(token)
+
+    def markCurrent(self, stage: str):
+        if not self.__enabled:
+            return
+        for trace in current_traces.get():
+            trace.mark(stage)
+
+    @property
+    def recent(self) -> list:
+        with self.__lock:
+            return list(self.__recent)
+
+
+tracer = Tracer(
+    config.Tracing.sample_rate if config.Tracing.enabled else 0,
+    config.Tracing.buffer_size,
+    config.Tracing.file
+)
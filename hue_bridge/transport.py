@@ -0,0 +1,210 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+if __name__ == '__main__':
+    exit('Please use "client.py"')
+
+
+from .configuration import config
+from .logger import root_logger
+from .rate_limiter import RateLimiter
+from .bridges import getBridge
+from .resilience import CircuitBreaker
+from .metrics import bridge_round_trip, current_service
+from .tracing import tracer
+from threading import Lock
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3 import disable_warnings as urllib3DisableWarnings
+from urllib3.exceptions import InsecureRequestWarning as urllib3InsecureRequestWarning
+import ssl, time
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+urllib3DisableWarnings(urllib3InsecureRequestWarning)
+
+
+def createSSLContext() -> ssl.SSLContext:
+    # bridges use self-signed certificates, so verification stays disabled like before
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class PoolAdapter(HTTPAdapter):
+    def __init__(self, ssl_context: ssl.SSLContext, pool_size: int):
+        self.__ssl_context = ssl_context
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.__ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.__ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+class Transport:
+    def __init__(self, bridge_id: str, api_path: str, api_key: str, host: str = None):
+        self.__bridge_id = bridge_id
+        self.__api_path = api_path
+        self.__api_key = api_key
+        self.__timeout = (config.Bridge.connect_timeout, config.Bridge.read_timeout)
+        self.__session = Session()
+        self.__session.verify = False
+        self.__session.mount("https://", PoolAdapter(createSSLContext(), config.Bridge.pool_size))
+        self.__rate_limiter = RateLimiter(
+            config.Bridge.light_rate,
+            config.Bridge.light_burst,
+            config.Bridge.group_rate,
+            config.Bridge.group_burst
+        )
+        self.__breaker = CircuitBreaker(bridge_id, config.Resilience.failure_threshold, config.Resilience.reset_timeout)
+        self.__lock = Lock()
+        self.__host = None
+        self.__lights_url = None
+        self.__light_url = None
+        self.__light_state_url = None
+        self.__groups_url = None
+        self.__group_url = None
+        self.__group_action_url = None
+        self.__event_stream_url = None
+        if host:
+            self.host = host
+
+    @property
+    def bridge_id(self) -> str:
+        return self.__bridge_id
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return self.__rate_limiter
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.__breaker
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @property
+    def light_url(self) -> str:
+        return self.__light_url
+
+    @property
+    def light_state_url(self) -> str:
+        return self.__light_state_url
+
+    @host.setter
+    def host(self, arg: str):
+        with self.__lock:
+            if arg != self.__host:
+                base_url = "https://{}/{}/{}".format(arg, self.__api_path, self.__api_key)
+                self.__lights_url = "{}/lights".format(base_url)
+                self.__light_url = self.__lights_url + "/{}"
+                self.__light_state_url = self.__lights_url + "/{}/state"
+                self.__groups_url = "{}/groups".format(base_url)
+                self.__group_url = self.__groups_url + "/{}"
+                self.__group_action_url = self.__groups_url + "/{}/action"
+                self.__event_stream_url = "https://{}/eventstream/clip/v2".format(arg)
+                self.__host = arg
+                # connections to a previous host are of no use anymore
+                self.__session.close()
+                logger.debug("'{}': using host '{}'".format(self.__bridge_id, arg))
+
+    def __timed(self, operation: str, request, *args, **kwargs):
+        tracer.markCurrent("bridge_request")
+        start = time.perf_counter()
+        try:
+            return request(*args, **kwargs)
+        finally:
+            bridge_round_trip.observe(time.perf_counter() - start, self.__bridge_id, operation, current_service.get())
+            tracer.markCurrent("bridge_response")
+
+    def getLights(self):
+        return self.__timed("get_lights", self.__session.get, self.__lights_url, timeout=self.__timeout)
+
+    def getLight(self, number: str):
+        return self.__timed("get_light", self.__session.get, self.__light_url.format(number), timeout=self.__timeout)
+
+    def putLightState(self, number: str, data: dict):
+        self.__rate_limiter.light.acquire()
+        return self.__timed(
+            "put_light",
+            self.__session.put,
+            self.__light_state_url.format(number),
+            json=data,
+            timeout=self.__timeout
+        )
+
+    def getGroups(self):
+        return self.__session.get(self.__groups_url, timeout=self.__timeout)
+
+    def createGroup(self, name: str, lights: list):
+        return self.__session.post(
+            self.__groups_url,
+            json={"name": name, "lights": lights, "type": "LightGroup"},
+            timeout=self.__timeout
+        )
+
+    def deleteGroup(self, number: str):
+        return self.__session.delete(self.__group_url.format(number), timeout=self.__timeout)
+
+    def putGroupAction(self, number: str, data: dict):
+        self.__rate_limiter.group.acquire()
+        return self.__timed(
+            "put_group",
+            self.__session.put,
+            self.__group_action_url.format(number),
+            json=data,
+            timeout=self.__timeout
+        )
+
+    def openEventStream(self, last_event_id: str = None, url: str = None):
+        headers = {"hue-application-key": self.__api_key, "Accept": "text/event-stream"}
+        if last_event_id:
+            headers["Last-Event-ID"] = last_event_id
+        return self.__session.get(
+            url or self.__event_stream_url,
+            headers=headers,
+            stream=True,
+            timeout=(config.Bridge.connect_timeout, config.Monitor.stream_timeout)
+        )
+
+    def close(self):
+        self.__session.close()
+
+
+transport_pool = dict()
+transport_pool_lock = Lock()
+
+
+def getTransport(bridge_id: str) -> Transport:
+    with transport_pool_lock:
+        if bridge_id not in transport_pool:
+            bridge = getBridge(bridge_id)
+            transport_pool[bridge_id] = Transport(
+                bridge_id,
+                config.Bridge.api_path,
+                bridge.api_key,
+                bridge.host
+            )
+        return transport_pool[bridge_id]
@@ -14,114 +14,129 @@
    limitations under the License.
 """
 
-
-__all__ = ('device_type_map', 'ExtendedColorLight')
+__all__ = ('device_type_map', 'DeviceState', 'HueDevice', 'ExtendedColorLight', 'ColorLight', 'OnOffPlugInUnit')
 
 if __name__ == '__main__':
     exit('Please use "client.py"')
 
 
 from .service import SetPower, SetKelvin, SetColor, SetBrightness, GetStatus, PlugSetPower, PlugGetStatus, GetStatusCL
-from threading import Lock
 from ..configuration import config
-import cc_lib
+import time, cc_lib
 
 
-class ExtendedColorLight(cc_lib.types.Device):
-    device_type_id = config.Senergy.dt_extended_color_light
-    services = (SetPower, SetColor, SetBrightness, SetKelvin, GetStatus)
+# the only bridge state fields the services and the monitor read, everything else the bridge reports is dropped
+state_fields = ("on", "bri", "xy", "ct", "reachable")
 
-    def __init__(self, id: str, name: str, model: str, state: dict, number: str):
-        self.id = id
-        self.name = name
-        self.model = model
-        self.number = number
-        self.__state_lock = Lock()
-        self.state = state
 
-    @property
-    def state(self):
-        with self.__state_lock:
-            return self.__state
+class DeviceState:
+    # never changed after creation, updates create a new record so readers always see a consistent state without locking
+    __slots__ = state_fields
 
-    @state.setter
-    def state(self, arg):
-        with self.__state_lock:
-            self.__state = arg
+    def __init__(self, on: bool = False, bri: int = None, xy: tuple = None, ct: int = None, reachable: bool = False):
+        self.on = on
+        self.bri = bri
+        self.xy = xy
+        self.ct = ct
+        self.reachable = reachable
 
-    def getService(self, srv_handler: str, *args, **kwargs):
-        service = super().getService(srv_handler)
-        return service.task(self, *args, **kwargs)
+    @classmethod
+    def fromDict(cls, state: dict):
+        xy = state.get("xy")
+        return cls(
+            state.get("on", False),
+            state.get("bri"),
+            tuple(xy) if xy is not None else None,
+            state.get("ct"),
+            state.get("reachable", False)
+        )
 
-    def __iter__(self):
-        items = (
-            ("name", self.name),
-            ("model", self.model),
-            ("state", self.state),
-            ("number", self.number)
+    def merge(self, update: dict):
+        if not update:
+            return self
+        xy = update.get("xy", self.xy)
+        return DeviceState(
+            update.get("on", self.on),
+            update.get("bri", self.bri),
+            tuple(xy) if xy is not None else None,
+            update.get("ct", self.ct),
+            update.get("reachable", self.reachable)
         )
-        for item in items:
-            yield item
 
+    def toDict(self) -> dict:
+        return {key: getattr(self, key) for key in state_fields}
 
-class ColorLight(cc_lib.types.Device):
-    device_type_id = config.Senergy.dt_color_light
-    services = (SetPower, SetColor, SetBrightness, GetStatusCL)
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in state_fields else default
 
-    def __init__(self, id: str, name: str, model: str, state: dict, number: str):
-        self.id = id
-        self.name = name
-        self.model = model
-        self.number = number
-        self.__state_lock = Lock()
-        self.state = state
+    def __getitem__(self, key: str):
+        if key not in state_fields:
+            raise KeyError(key)
+        return getattr(self, key)
 
-    @property
-    def state(self):
-        with self.__state_lock:
-            return self.__state
+    def __eq__(self, other):
+        if not isinstance(other, DeviceState):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in state_fields)
 
-    @state.setter
-    def state(self, arg):
-        with self.__state_lock:
-            self.__state = arg
+    def __hash__(self):
+        return hash(tuple(getattr(self, key) for key in state_fields))
 
-    def getService(self, srv_handler: str, *args, **kwargs):
-        service = super().getService(srv_handler)
-        return service.task(self, *args, **kwargs)
+    def __repr__(self):
+        return "DeviceState({})".format(", ".join("{}={!r}".format(key, getattr(self, key)) for key in state_fields))
 
-    def __iter__(self):
-        items = (
-            ("name", self.name),
-            ("model", self.model),
-            ("state", self.state),
-            ("number", self.number)
-        )
-        for item in items:
-            yield item
 
+def getServices(capabilities: frozenset) -> tuple:
+    # plugs only switch, lights offer a service per capability and a status matching them
+    if "dimming" not in capabilities:
+        return PlugSetPower, PlugGetStatus
+    services = [SetPower]
+    if "color" in capabilities:
+        services.append(SetColor)
+    services.append(SetBrightness)
+    if "color_temperature" in capabilities:
+        services += (SetKelvin, GetStatus)
+    else:
+        services.append(GetStatusCL)
+    return tuple(services)
 
-class OnOffPlugInUnit(cc_lib.types.Device):
-    device_type_id = config.Senergy.dt_on_off_plug_in_unit
-    services = (PlugSetPower, PlugGetStatus)
 
-    def __init__(self, id: str, name: str, model: str, state: dict, number: str):
+class HueDevice(cc_lib.types.Device):
+    device_type_id = None
+    services = ()
+    capabilities = frozenset()
+    __slots__ = ("model", "number", "bridge_id", "__state", "__state_time")
+
+    def __init__(self, id: str, name: str, model: str, state: dict, number: str, bridge_id: str = None):
         self.id = id
         self.name = name
         self.model = model
         self.number = number
-        self.__state_lock = Lock()
+        self.bridge_id = bridge_id or config.Bridge.id
         self.state = state
 
     @property
-    def state(self):
-        with self.__state_lock:
-            return self.__state
+    def state(self) -> DeviceState:
+        return self.__state
 
     @state.setter
     def state(self, arg):
-        with self.__state_lock:
-            self.__state = arg
+        self.__state = arg if isinstance(arg, DeviceState) else DeviceState.fromDict(arg)
+        self.__state_time = time.monotonic()
+
+    @property
+    def state_age(self) -> float:
+        return time.monotonic() - self.__state_time
+
+    def touch(self):
+        self.__state_time = time.monotonic()
+
+    def expire(self):
+        # the state is kept for reading but never counts as fresh until it is set or touched again
+        self.__state_time = float("-inf")
+
+    def getServiceType(self, srv_handler: str):
+        return super().getService(srv_handler)
 
     def getService(self, srv_handler: str, *args, **kwargs):
         service = super().getService(srv_handler)
@@ -131,13 +146,37 @@ class OnOffPlugInUnit(cc_lib.types.Device):
         items = (
             ("name", self.name),
             ("model", self.model),
-            ("state", self.state),
+            ("state", self.state.toDict()),
             ("number", self.number)
         )
         for item in items:
             yield item
 
 
+def createDeviceType(name: str, device_type_id: str, capabilities: tuple) -> type:
+    capabilities = frozenset(capabilities)
+    return type(
+        name,
+        (HueDevice,),
+        {
+            "__slots__": (),
+            "__module__": __name__,
+            "device_type_id": device_type_id,
+            "capabilities": capabilities,
+            "services": getServices(capabilities)
+        }
+    )
+
+
+ExtendedColorLight = createDeviceType(
+    "ExtendedColorLight",
+    config.Senergy.dt_extended_color_light,
+    ("dimming", "color", "color_temperature")
+)
+ColorLight = createDeviceType("ColorLight", config.Senergy.dt_color_light, ("dimming", "color"))
+OnOffPlugInUnit = createDeviceType("OnOffPlugInUnit", config.Senergy.dt_on_off_plug_in_unit, ())
+
+
 device_type_map = {
     "Extended color light": ExtendedColorLight,
     "Color light": ColorLight,
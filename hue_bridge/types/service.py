@@ -22,19 +22,35 @@ if __name__ == '__main__':
     exit('Please use "client.py"')
 
 
-from ..configuration import config
 from ..logger import root_logger
-from rgbxy import Converter, GamutB, GamutC, GamutA
-from requests import put, get, exceptions
-import cc_lib, colorsys, datetime
+from ..transport import getTransport
+from ..state_cache import state_cache
+from ..metrics import bridge_errors
+from ..resilience import callWithRetry
+from ..color import ColorEngine, getColorEngine
+from rgbxy import GamutB, GamutC, GamutA
+from functools import partial
+import cc_lib, datetime
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 converter_pool = dict()
 
+gamut_pool = dict()
+
+
+def registerGamut(model_id: str, gamut):
+    # gamuts reported by the bridge take precedence over the built-in model list
+    gamut = tuple(tuple(point) for point in gamut)
+    if gamut_pool.get(model_id) != gamut:
+        gamut_pool[model_id] = gamut
+        converter_pool.pop(model_id, None)
+
 
 def getGamut(model_id):
+    if model_id in gamut_pool:
+        return gamut_pool[model_id]
     # https://developers.meethue.com/develop/hue-api/supported-devices/
     if model_id in ("LCT001", "LCT007", "LCT002", "LCT003", "LLM001"):
         return GamutB
@@ -43,77 +59,110 @@ def getGamut(model_id):
     elif model_id in ("LLC010", "LLC006", "LST001", "LLC011", "LLC012", "LLC005", "LLC007", "LLC014"):
         return GamutA
     else:
-        logger.warning("Model '{}' not supported - defaulting to Gamut C")
+        logger.warning("Model '{}' not supported - defaulting to Gamut C".format(model_id))
         return GamutC
 
 
-def getConverter(model: str):
+def getConverter(model: str) -> ColorEngine:
     if not model in converter_pool:
-        converter = Converter(getGamut(model))
+        converter = getColorEngine(getGamut(model))
         converter_pool[model] = converter
         return converter
     return converter_pool[model]
 
 
-def hueBridgePut(d_number: str, data: dict):
-    try:
-        resp = put(
-            url="https://{}/{}/{}/lights/{}/state".format(
-                config.Bridge.host,
-                config.Bridge.api_path,
-                config.Bridge.api_key,
-                d_number
-            ),
-            json=data,
-            verify=False
-        )
-        if resp.status_code == 200:
-            resp = resp.json()
-            if isinstance(resp, list):
-                if "success" in resp[0]:
-                    return False, "ok"
-                if "error" in resp[0]:
-                    return True, resp[0]["error"]["description"]
-            else:
-                return True, "unknown error"
-        else:
-            return True, resp.status_code
-    except exceptions.RequestException:
-        return True, "could not send request to hue bridge"
-
-
-def hueBridgeGet(d_number: str):
-    try:
-        resp = get(
-            url="https://{}/{}/{}/lights/{}".format(
-                config.Bridge.host,
-                config.Bridge.api_path,
-                config.Bridge.api_key,
-                d_number
-            ),
-            verify=False
-        )
-        if resp.status_code == 200:
-            resp = resp.json()
-            if isinstance(resp, dict):
-                return False, resp["state"]
-            elif isinstance(resp, list):
+def evaluatePutResponse(status_code: int, resp):
+    if status_code == 200:
+        if isinstance(resp, list):
+            if "success" in resp[0]:
+                return False, "ok"
+            if "error" in resp[0]:
                 return True, resp[0]["error"]["description"]
-            else:
-                return True, "unknown error"
-        else:
-            return True, resp.status_code
-    except exceptions.RequestException:
-        return True, "could not send request to hue bridge"
-
-
-def convertHSBToRGB(hue, sat, bri):
-    return tuple(round(val * 255) for val in colorsys.hsv_to_rgb(hue / 360, sat / 100, bri / 100))
+        return True, "unknown error"
+    else:
+        return True, status_code
 
 
-def convertRGBToHSB(red, green, blue):
-    hue, saturation, brightness = colorsys.rgb_to_hsv(red / 255, green / 255, blue / 255)
-    return (round(hue * 360), round(saturation * 100), round(brightness * 100))
+def evaluateGetResponse(status_code: int, resp):
+    if status_code == 200:
+        if isinstance(resp, dict):
+            return False, resp["state"]
+        elif isinstance(resp, list):
+            return True, resp[0]["error"]["description"]
+        else:
+            return True, "unknown error"
+    else:
+        return True, status_code
+
+
+def hueBridgePut(bridge_id: str, d_number: str, data: dict):
+    transport = getTransport(bridge_id)
+    err, body = callWithRetry(
+        transport.breaker,
+        partial(transport.putLightState, d_number, data),
+        evaluatePutResponse,
+        "put_light"
+    )
+    if err:
+        bridge_errors.inc(bridge_id, "put_light")
+    return err, body
+
+
+def hueBridgeGroupPut(bridge_id: str, g_number: str, data: dict):
+    transport = getTransport(bridge_id)
+    err, body = callWithRetry(
+        transport.breaker,
+        partial(transport.putGroupAction, g_number, data),
+        evaluatePutResponse,
+        "put_group"
+    )
+    if err:
+        bridge_errors.inc(bridge_id, "put_group")
+    return err, body
+
+
+def hueBridgeGet(bridge_id: str, d_number: str):
+    transport = getTransport(bridge_id)
+    err, body = callWithRetry(transport.breaker, partial(transport.getLight, d_number), evaluateGetResponse, "get_light")
+    if err:
+        bridge_errors.inc(bridge_id, "get_light")
+    return err, body
+
+
+def updateState(device, data: dict):
+    device.state = device.state.merge({key: data[key] for key in ("on", "bri", "xy", "ct") if key in data})
+
+
+def putState(device, data: dict):
+    err, body = hueBridgePut(device.bridge_id, device.number, data)
+    if not err:
+        updateState(device, data)
+    return err, body
+
+
+def getState(device):
+    if state_cache.isFresh(device.bridge_id, device):
+        return False, device.state
+    err, body = hueBridgeGet(device.bridge_id, device.number)
+    if not err:
+        device.state = body
+        return err, device.state
+    return err, body
+
+
+def mergeStates(bodies) -> dict:
+    # later bodies win, xy and ct are mutually exclusive color modes
+    merged = dict()
+    for body in bodies:
+        if "xy" in body:
+            merged.pop("ct", None)
+        elif "ct" in body:
+            merged.pop("xy", None)
+        merged.update(body)
+    if merged.get("on") is False:
+        # a light that is switched off rejects every other attribute
+        merged = {key: merged[key] for key in ("on", "transitiontime") if key in merged}
+    return merged
 
 
 ### Extended color light ###
@@ -139,17 +188,18 @@ def convertRGBToHSB(red, green, blue):
 class SetColor(cc_lib.types.Service):
     local_id = "setColor"
 
+    @staticmethod
+    def body(device, hue: int, saturation: int, brightness: int, duration: float):
+        return {
+            "on": True,
+            "xy": getConverter(device.model).hsbToXY(hue, saturation, brightness or 1),
+            "bri": round(brightness * 255 / 100),
+            "transitiontime": int(duration * 10)
+        }
+
     @staticmethod
     def task(device, hue: int, saturation: int, brightness: int, duration: float):
-        err, body = hueBridgePut(
-            device.number,
-            {
-                "on": True,
-                "xy": getConverter(device.model).rgb_to_xy(*convertHSBToRGB(hue, saturation, brightness or 1)),
-                "bri": round(brightness * 255 / 100),
-                "transitiontime": int(duration * 10)
-            }
-        )
+        err, body = putState(device, __class__.body(device, hue, saturation, brightness, duration))
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         return {"status": int(err)}
@@ -191,9 +241,13 @@ class SetColor(cc_lib.types.Service):
 class SetPower(cc_lib.types.Service):
     local_id = "setPower"
 
+    @staticmethod
+    def body(device, power):
+        return {"on": power}
+
     @staticmethod
     def task(device, power):
-        err, body = hueBridgePut(device.number, {"on": power})
+        err, body = putState(device, __class__.body(device, power))
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         return {"status": int(err)}
@@ -202,12 +256,13 @@ class SetPower(cc_lib.types.Service):
 class SetBrightness(cc_lib.types.Service):
     local_id = "setBrightness"
 
+    @staticmethod
+    def body(device, brightness, duration):
+        return {"on": True, "bri": round(brightness * 255 / 100), "transitiontime": int(duration * 10)}
+
     @staticmethod
     def task(device, brightness, duration):
-        err, body = hueBridgePut(
-            device.number,
-            {"on": True, "bri": round(brightness * 255 / 100), "transitiontime": int(duration * 10)}
-        )
+        err, body = putState(device, __class__.body(device, brightness, duration))
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         return {"status": int(err)}
@@ -216,17 +271,18 @@ class SetBrightness(cc_lib.types.Service):
 class SetKelvin(cc_lib.types.Service):
     local_id = "setKelvin"
 
+    @staticmethod
+    def body(device, kelvin, brightness, duration):
+        return {
+            "on": True,
+            "ct": round(1000000 / kelvin),
+            "bri": round(brightness * 255 / 100),
+            "transitiontime": int(duration * 10)
+        }
+
     @staticmethod
     def task(device, kelvin, brightness, duration):
-        err, body = hueBridgePut(
-            device.number,
-            {
-                "on": True,
-                "ct": round(1000000 / kelvin),
-                "bri": round(brightness * 255 / 100),
-                "transitiontime": int(duration * 10)
-            }
-        )
+        err, body = putState(device, __class__.body(device, kelvin, brightness, duration))
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         return {"status": int(err)}
@@ -236,7 +292,7 @@ class GetStatus(cc_lib.types.Service):
     local_id = "getStatus"
 
     @staticmethod
-    def task(device):
+    def payload(device, err, body):
         payload = {
                 "status": 0,
                 "on": False,
@@ -246,25 +302,28 @@ class GetStatus(cc_lib.types.Service):
                 "kelvin": 0,
                 "time": "{}Z".format(datetime.datetime.utcnow().isoformat())
             }
-        err, body = hueBridgeGet(device.number)
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         else:
-            hsb = convertRGBToHSB(*getConverter(device.model).xy_to_rgb(body["xy"][0], body["xy"][1]))
-            payload["on"] = body["on"]
+            hsb = getConverter(device.model).xyToHSB(body.xy[0], body.xy[1])
+            payload["on"] = body.on
             payload["hue"] = hsb[0]
             payload["saturation"] = hsb[1]
             payload["brightness"] = hsb[2]
-            payload["kelvin"] = round(round(1000000 / body["ct"]) / 10) * 10
+            payload["kelvin"] = round(round(1000000 / body.ct) / 10) * 10
         payload["status"] = int(err)
         return payload
 
+    @staticmethod
+    def task(device):
+        return __class__.payload(device, *getState(device))
+
 
 class GetStatusCL(cc_lib.types.Service):
     local_id = "getStatus"
 
     @staticmethod
-    def task(device):
+    def payload(device, err, body):
         payload = {
                 "status": 0,
                 "on": False,
@@ -273,18 +332,21 @@ class GetStatusCL(cc_lib.types.Service):
                 "brightness": 0,
                 "time": "{}Z".format(datetime.datetime.utcnow().isoformat())
             }
-        err, body = hueBridgeGet(device.number)
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         else:
-            hsb = convertRGBToHSB(*getConverter(device.model).xy_to_rgb(body["xy"][0], body["xy"][1]))
-            payload["on"] = body["on"]
+            hsb = getConverter(device.model).xyToHSB(body.xy[0], body.xy[1])
+            payload["on"] = body.on
             payload["hue"] = hsb[0]
             payload["saturation"] = hsb[1]
             payload["brightness"] = hsb[2]
         payload["status"] = int(err)
         return payload
 
+    @staticmethod
+    def task(device):
+        return __class__.payload(device, *getState(device))
+
 
 ### On/Off plug-in unit ###
 
@@ -314,9 +376,13 @@ class GetStatusCL(cc_lib.types.Service):
 class PlugSetPower(cc_lib.types.Service):
     local_id = "setPower"
 
+    @staticmethod
+    def body(device, power):
+        return {"on": power}
+
     @staticmethod
     def task(device, power):
-        err, body = hueBridgePut(device.number, {"on": power})
+        err, body = putState(device, __class__.body(device, power))
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         return {"status": int(err)}
@@ -326,16 +392,19 @@ class PlugGetStatus(cc_lib.types.Service):
     local_id = "getStatus"
 
     @staticmethod
-    def task(device):
+    def payload(device, err, body):
         payload = {
                 "status": 0,
                 "on": False,
                 "time": "{}Z".format(datetime.datetime.utcnow().isoformat())
             }
-        err, body = hueBridgeGet(device.number)
         if err:
             logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, body))
         else:
-            payload["on"] = body["on"]
+            payload["on"] = body.on
         payload["status"] = int(err)
         return payload
+
+    @staticmethod
+    def task(device):
+        return __class__.payload(device, *getState(device))
@@ -0,0 +1,45 @@
+"""
+   Copyright 2019 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+from hue_bridge.configuration import config
+from hue_bridge.bridges import loadBridges
+from hue_bridge.supervisor import Supervisor
+import time, random, cc_lib
+
+
+# shard processes are spawned and import this module again, everything runs behind the main guard
+if __name__ == '__main__':
+    connector_client = cc_lib.client.Client()
+    supervisor = Supervisor(connector_client, loadBridges())
+    # a warm start serves commands from the snapshot right away, the delay only spreads cold starts
+    if config.RuntimeEnv.max_start_delay > 0 and not supervisor.device_manager.devices:
+        delay = random.randint(1, config.RuntimeEnv.max_start_delay)
+        print("delaying start for {}s".format(delay))
+        time.sleep(delay)
+    connector_client.setConnectClbk(supervisor.onConnect)
+    while True:
+        try:
+            connector_client.initHub()
+            break
+        except cc_lib.client.HubInitializationError:
+            time.sleep(10)
+    connector_client.connect(reconnect=True)
+    supervisor.start()
+    try:
+        supervisor.join()
+    except KeyboardInterrupt:
+        print("\ninterrupted by user\n")